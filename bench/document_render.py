@@ -0,0 +1,92 @@
+"""
+Document rendering: the per-view loop the handlers used to run against
+``bot.core.documents``.
+
+Renders the same large, nested document repeatedly with both and reports
+microseconds per render, the number of messages and the longest one (the
+old loop never split, so anything over 4096 characters was rejected by
+Telegram).
+
+    python -m bench.document_render --fields 400 --depth 3
+"""
+
+import argparse
+import json
+import os
+import timeit
+
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("API_URL", "http://127.0.0.1:1")
+
+from aiogram.utils.markdown import hbold  # noqa: E402
+
+from bot.core import documents  # noqa: E402
+from bot.core.text import TELEGRAM_MESSAGE_LIMIT  # noqa: E402
+
+
+def make_document(fields: int, depth: int) -> dict:
+    def level(n: int, prefix: str) -> dict:
+        data = {
+            f"{prefix}field_{i}": f"Value <{i}> & co. from {prefix or 'root'}"
+            for i in range(n)
+        }
+
+        if depth > prefix.count("_section"):
+            data[f"{prefix}section"] = level(n // 2, f"{prefix}section_")
+
+        return data
+
+    return level(fields, "")
+
+
+def legacy(name: str, data: dict) -> list[str]:
+    # What callback_query_handler did: two levels only, labels unescaped
+    parts = [f"{hbold(name)}\n"]
+
+    for key, value in data.items():
+        if isinstance(value, dict):
+            for k, v in value.items():
+                parts.append(
+                    f"{key.replace('_', ' ').capitalize()} {k.replace('_', ' ').capitalize()}\n{hbold(v)}\n"
+                )
+        else:
+            parts.append(f"{key.replace('_', ' ').capitalize()}\n{hbold(value)}\n")
+
+    return ["\n".join(parts)]
+
+
+def measure(name: str, render, document: dict, number: int) -> dict:
+    messages = render("Passport", document)
+    seconds = timeit.timeit(lambda: render("Passport", document), number=number)
+
+    return {
+        "renderer": name,
+        "us_per_render": round(seconds / number * 1e6, 1),
+        "messages": len(messages),
+        "max_message_length": max(map(len, messages)),
+        "fits": all(len(m) <= TELEGRAM_MESSAGE_LIMIT for m in messages),
+    }
+
+
+def main(args: argparse.Namespace) -> None:
+    document = make_document(args.fields, args.depth)
+
+    for result in (
+        measure("legacy loop", legacy, document, args.number),
+        measure(
+            "bot.core.documents",
+            lambda name, data: documents.render(data, title=name),
+            document,
+            args.number,
+        ),
+    ):
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fields", type=int, default=400)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--number", type=int, default=500)
+
+    main(parser.parse_args())
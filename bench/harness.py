@@ -0,0 +1,365 @@
+"""
+Offline benchmark of the real dispatcher.
+
+Feeds synthetic updates straight into ``bot.__main__.dp`` with a fake Bot
+session and a local stub of the ApexID API, so neither Telegram nor ApexID
+is involved. Redis is the one from ``REDIS_URL``, or an in-process fakeredis
+server with ``--fakeredis``.
+
+Each scenario runs ``--users`` users, ``--concurrency`` of them at a time,
+every user sending its updates one after another (as a real chat does). The
+report has updates/sec, p50/p95/p99 update latency, upstream calls and the
+peak traced memory of a second, traced pass.
+
+    python -m bench.harness --fakeredis --output before.json
+    python -m bench.harness --fakeredis --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import io
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import tracemalloc
+
+SCENARIOS = (
+    "start",
+    "login",
+    "first_commands",
+    "documents",
+    "double_tap",
+    "notifications",
+    "photo",
+    "album",
+)
+# Photos per album, distinct codes per photo
+ALBUM_SIZE = 3
+SHEET_CODES = 4
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_fakeredis() -> str:
+    from fakeredis import TcpFakeServer
+
+    port = free_port()
+    server = TcpFakeServer(("127.0.0.1", port), server_type="redis")
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    return f"redis://127.0.0.1:{port}/0"
+
+
+def percentile(values: list[float], q: float) -> float:
+    return values[min(int(len(values) * q), len(values) - 1)]
+
+
+def qr_photo(data: str, side: int) -> bytes:
+    import qrcode
+
+    image = qrcode.make(data).get_image().convert("RGB").resize((side, side))
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def qr_sheet(codes: list[str], side: int) -> bytes:
+    # Several codes side by side, as in a photo of a stack of documents
+    import qrcode
+    from PIL import Image
+
+    sheet = Image.new("RGB", (side * len(codes), side), "white")
+
+    for i, data in enumerate(codes):
+        code = qrcode.make(data).get_image().convert("RGB").resize((side, side))
+        sheet.paste(code, (i * side, 0))
+
+    buffer = io.BytesIO()
+    sheet.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+class Harness:
+    def __init__(self, args: argparse.Namespace, api_port: int) -> None:
+        # Imported late: settings are read from the environment at import time
+        from aiogram import Bot
+        from aiogram.client.default import DefaultBotProperties
+        from aiogram.enums import ParseMode
+
+        import bot.__main__ as app
+        from bench.stubs import FakeSession, StubApexID, StubTelegram
+
+        self.args = args
+        self.app = app
+        self.api_port = api_port
+        self.telegram = StubTelegram()
+        self.apexid = StubApexID(latency=args.api_latency / 1000)
+        self.bot = Bot(
+            app.TOKEN,
+            session=FakeSession(self.telegram),
+            default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        )
+        self._user_ids = iter(range(10_000, 10**9))
+
+        self.telegram.files["qr_small"] = qr_photo("%024x" % 0xC0DE, 320)
+        self.telegram.files["qr_large"] = qr_photo("%024x" % 0xC0DE, 1280)
+
+        for i in range(ALBUM_SIZE):
+            codes = [
+                "%024x" % (0xC0DE00 + i * SHEET_CODES + n) for n in range(SHEET_CODES)
+            ]
+            self.telegram.files[f"sheet_{i}"] = qr_sheet(codes, 400)
+
+    async def __aenter__(self) -> "Harness":
+        await self.apexid.start(port=self.api_port)
+
+        self.app.setup(self.bot)
+        await self.app.dp.emit_startup(bot=self.bot, dispatcher=self.app.dp)
+
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.app.dp.emit_shutdown(bot=self.bot, dispatcher=self.app.dp)
+        await self.apexid.stop()
+
+    async def login(self, user_id: int) -> None:
+        from bot.core.redis import set_user
+
+        await set_user(
+            user_id,
+            {
+                "id": str(user_id),
+                "email": f"user{user_id}@bench",
+                "first_name": "Bench",
+                "token": f"token-user{user_id}@bench",
+            },
+        )
+
+    async def updates(self, scenario: str, user_id: int) -> list[dict]:
+        from bench.stubs import callback_update, message_update, photo_update
+
+        if scenario == "start":
+            return [message_update(user_id, "/start")]
+
+        if scenario == "login":
+            return [
+                message_update(user_id, "/login"),
+                message_update(user_id, f"user{user_id}@bench"),
+                message_update(user_id, "password"),
+            ]
+
+        if scenario == "first_commands":
+            # What a user typically does right after logging in
+            return [
+                *await self.updates("login", user_id),
+                message_update(user_id, "/documents"),
+                message_update(user_id, "/cabinet"),
+                message_update(user_id, "/notifications"),
+            ]
+
+        if scenario == "documents":
+            await self.login(user_id)
+            document = random.choice(self.apexid.documents)
+            return [
+                message_update(user_id, "/documents"),
+                callback_update(user_id, f"document_{document['_id']}"),
+            ]
+
+        if scenario == "double_tap":
+            # The same button tapped twice in a row arrives as two updates
+            await self.login(user_id)
+            document = random.choice(self.apexid.documents)
+            data = f"document_{document['_id']}"
+            return [
+                [
+                    callback_update(user_id, data, message_id=user_id),
+                    callback_update(user_id, data, message_id=user_id),
+                ]
+            ]
+
+        if scenario == "notifications":
+            await self.login(user_id)
+            return [message_update(user_id, "/notifications")]
+
+        if scenario == "photo":
+            return [
+                photo_update(
+                    user_id, [("qr_small", 320, 320), ("qr_large", 1280, 1280)]
+                )
+            ]
+
+        if scenario == "album":
+            # Telegram delivers album photos as separate updates at once
+            group = f"album-{user_id}"
+            return [
+                [
+                    photo_update(
+                        user_id,
+                        [(f"sheet_{i}", 400 * SHEET_CODES, 400)],
+                        media_group_id=group,
+                    )
+                    for i in range(ALBUM_SIZE)
+                ]
+            ]
+
+        raise ValueError(scenario)
+
+    async def run(self, scenario: str, traced: bool = False) -> dict:
+        users = [next(self._user_ids) for _ in range(self.args.users)]
+        flows = {user_id: await self.updates(scenario, user_id) for user_id in users}
+
+        slots = asyncio.Semaphore(self.args.concurrency)
+        latencies: list[float] = []
+        errors = 0
+        upstream = sum(self.apexid.calls.values())
+        verified = self.apexid.calls["verify_code"]
+
+        async def flow(user_id: int) -> None:
+            nonlocal errors
+
+            async with slots:
+                for update in flows[user_id]:
+                    started = time.perf_counter()
+
+                    # A list is delivered concurrently, e.g. an album
+                    results = await asyncio.gather(
+                        *(
+                            self.app.dp.feed_raw_update(self.bot, update)
+                            for update in (
+                                update if isinstance(update, list) else [update]
+                            )
+                        ),
+                        return_exceptions=True,
+                    )
+                    errors += sum(isinstance(r, Exception) for r in results)
+
+                    latencies.append(time.perf_counter() - started)
+
+        if traced:
+            tracemalloc.start()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(flow(user_id) for user_id in users))
+        elapsed = time.perf_counter() - started
+
+        if traced:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return {"peak_memory_mb": round(peak / 2**20, 2)}
+
+        latencies.sort()
+        return {
+            "scenario": scenario,
+            "users": len(users),
+            "concurrency": self.args.concurrency,
+            "updates": len(latencies),
+            "errors": errors,
+            "updates_per_sec": round(len(latencies) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "upstream_calls": sum(self.apexid.calls.values()) - upstream,
+            "verified_per_sec": round(
+                (self.apexid.calls["verify_code"] - verified) / elapsed, 1
+            ),
+        }
+
+
+def compare(results: list[dict], baseline_path: str) -> None:
+    with open(baseline_path) as file:
+        baseline = {r["scenario"]: r for r in json.load(file)["results"]}
+
+    for result in results:
+        before = baseline.get(result["scenario"])
+
+        if before is None:
+            continue
+
+        print(
+            f"{result['scenario']:>14}: "
+            f"{before['updates_per_sec']:>9} -> {result['updates_per_sec']:>9} upd/s, "
+            f"p99 {before['p99_ms']:>8} -> {result['p99_ms']:>8} ms"
+        )
+
+
+async def main(args: argparse.Namespace, api_port: int) -> list[dict]:
+    results = []
+
+    async with Harness(args, api_port) as harness:
+        for scenario in args.scenario:
+            result = await harness.run(scenario)
+
+            if args.memory:
+                result.update(await harness.run(scenario, traced=True))
+
+            print(json.dumps(result))
+            results.append(result)
+
+    return results
+
+
+def configure(args: argparse.Namespace) -> int:
+    api_port = free_port()
+
+    if args.fakeredis:
+        os.environ["REDIS_URL"] = start_fakeredis()
+
+    os.environ.update(
+        {
+            "BOT_TOKEN": "42:bench",
+            "API_URL": f"http://127.0.0.1:{api_port}",
+            "METRICS_PORT": str(free_port()),
+            "NOTIFIER_ENABLED": "false",
+            # The fake session has no flood limits, measure the bot itself
+            "OUTBOX_GLOBAL_RATE": "1000000",
+            "OUTBOX_CHAT_RATE": "1000000",
+            "OUTBOX_CHAT_BURST": "1000000",
+            # Still long enough to catch every photo of an in-process album
+            "MEDIA_GROUP_WINDOW": "0.1",
+        }
+    )
+
+    return api_port
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--api-latency", type=float, default=20, help="ms")
+    parser.add_argument("--fakeredis", action="store_true")
+    parser.add_argument("--no-memory", dest="memory", action="store_false")
+    parser.add_argument("--output")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    api_port = configure(args)
+    results = asyncio.run(main(args, api_port))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(
+                {
+                    "started_at": datetime.datetime.now().isoformat(),
+                    "args": vars(args),
+                    "results": results,
+                },
+                file,
+                indent=2,
+            )
+
+    if args.compare:
+        compare(results, args.compare)
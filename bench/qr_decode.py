@@ -0,0 +1,135 @@
+"""
+QR decode latency and success rate over a corpus of photos.
+
+Compares the previous strategy (decode the full-size image as is) with the
+downscaled grayscale pass used by ``bot.core.qr``, then measures pool
+throughput through ``qr.decode``.
+
+    python -m bench.qr_decode --corpus path/to/photos
+    python -m bench.qr_decode            # generates a synthetic corpus
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import statistics
+import time
+from pathlib import Path
+
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("API_URL", "http://127.0.0.1:1")
+
+import qrcode  # noqa: E402
+from PIL import Image, ImageFilter  # noqa: E402
+from pyzbar.pyzbar import decode as zbar_decode  # noqa: E402
+
+from bot.core import config, qr  # noqa: E402
+
+
+def synthetic_corpus(count: int) -> list[bytes]:
+    # Camera-like photos: a QR code pasted on a large noisy canvas, blurred
+    rng = random.Random(42)
+    corpus = []
+
+    for _ in range(count):
+        code = qrcode.make("%024x" % rng.getrandbits(96)).convert("L")
+        side = rng.choice([1280, 1920, 2560])
+        canvas = Image.effect_noise((side, side), 40).convert("L")
+        code = code.resize((side // 3, side // 3))
+        canvas.paste(
+            code,
+            (rng.randint(0, side - code.width), rng.randint(0, side - code.height)),
+        )
+        canvas = canvas.filter(ImageFilter.GaussianBlur(rng.uniform(0, 1.5))).convert(
+            "RGB"
+        )
+
+        buffer = io.BytesIO()
+        canvas.save(buffer, format="JPEG", quality=85)
+        corpus.append(buffer.getvalue())
+
+    return corpus
+
+
+def load_corpus(path: Path) -> list[bytes]:
+    return [
+        file.read_bytes()
+        for file in sorted(path.iterdir())
+        if file.suffix.lower() in {".jpg", ".jpeg", ".png", ".webp"}
+    ]
+
+
+def full_resolution(data: bytes) -> list[str]:
+    return [
+        s.data.decode("utf-8", errors="replace")
+        for s in zbar_decode(Image.open(io.BytesIO(data)))
+    ]
+
+
+def measure(name: str, decoder, corpus: list[bytes]) -> dict:
+    latencies = []
+    decoded = 0
+
+    for data in corpus:
+        started = time.perf_counter()
+        result = decoder(data)
+        latencies.append(time.perf_counter() - started)
+        decoded += bool(result)
+
+    latencies.sort()
+    return {
+        "strategy": name,
+        "images": len(corpus),
+        "success_rate": round(decoded / len(corpus), 3),
+        "p50_ms": round(statistics.median(latencies) * 1000, 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+        "max_ms": round(latencies[-1] * 1000, 1),
+    }
+
+
+async def pool_throughput(corpus: list[bytes], rounds: int) -> dict:
+    jobs = corpus * rounds
+
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(qr.decode(data) for data in jobs), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - started
+
+    qr.shutdown()
+    return {
+        "strategy": f"qr.decode pool ({config.settings.QR_EXECUTOR} x{config.settings.QR_WORKERS})",
+        "images": len(jobs),
+        "images_per_sec": round(len(jobs) / elapsed, 1),
+        "rejected": sum(isinstance(result, qr.QueueFull) for result in results),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", type=Path)
+    parser.add_argument("--count", type=int, default=30)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.count)
+    max_side = config.settings.QR_DOWNSCALE_SIZE
+
+    results = [
+        measure("full resolution", full_resolution, corpus),
+        measure(
+            f"downscaled to {max_side} + fallback",
+            lambda data: qr.decode_image(data, max_side),
+            corpus,
+        ),
+        asyncio.run(pool_throughput(corpus, args.rounds)),
+    ]
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
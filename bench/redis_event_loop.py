@@ -0,0 +1,102 @@
+"""
+Event loop responsiveness under concurrent session lookups.
+
+Runs the same burst of simulated updates (``is_user_exist`` + ``get_user``)
+against the old synchronous client and the async session store while a probe
+task measures how late the event loop wakes it up.
+
+    REDIS_URL=redis://localhost:6379/0 python -m bench.redis_event_loop
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("API_URL", "http://127.0.0.1:1")
+
+import redis as sync_redis  # noqa: E402
+
+from bot.core import config  # noqa: E402
+from bot.core import redis as store  # noqa: E402
+from bot.core.session import unpack  # noqa: E402
+
+PROBE_INTERVAL = 0.001
+
+
+async def probe(lags: list[float], stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+
+
+async def run(name: str, update, users: int, concurrency: int) -> dict:
+    lags: list[float] = []
+    stop = asyncio.Event()
+    probe_task = asyncio.create_task(probe(lags, stop))
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def worker(user_id: int) -> None:
+        async with semaphore:
+            await update(user_id)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await probe_task
+
+    lags.sort()
+    return {
+        "client": name,
+        "updates": users,
+        "updates_per_sec": round(users / elapsed),
+        "loop_lag_p50_ms": round(statistics.median(lags) * 1000, 3),
+        "loop_lag_p99_ms": round(lags[int(len(lags) * 0.99) - 1] * 1000, 3),
+        "loop_lag_max_ms": round(lags[-1] * 1000, 3),
+        "probe_wakeups": len(lags),
+    }
+
+
+async def main(users: int, concurrency: int) -> None:
+    sync_client = sync_redis.Redis.from_url(config.settings.REDIS_URL)
+    payload = json.dumps({"id": "x", "token": "t" * 64})
+
+    for i in range(users):
+        await store.set_user(f"bench:{i}", json.loads(payload))
+
+    async def sync_update(user_id: int) -> None:
+        # What every handler did before: blocking calls inside a coroutine
+        if sync_client.get(store.session_key(f"bench:{user_id}")):
+            unpack(sync_client.get(store.session_key(f"bench:{user_id}")))
+
+    async def async_update(user_id: int) -> None:
+        if await store.is_user_exist(f"bench:{user_id}"):
+            await store.get_user(f"bench:{user_id}")
+
+    results = [
+        await run("sync redis.Redis", sync_update, users, concurrency),
+        await run("redis.asyncio pool", async_update, users, concurrency),
+    ]
+
+    for i in range(users):
+        await store.logout(f"bench:{i}")
+
+    sync_client.close()
+    await store.close()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.users, args.concurrency))
@@ -0,0 +1,127 @@
+"""
+ApexID outages, with and without ``bot.core.resilience``.
+
+Runs the harness' ``documents`` scenario through phases of injected faults
+on the ApexID stub (healthy, slow, down, recovered) and reports, per phase,
+the harness figures along with what reached ApexID and what the bot
+answered without asking it. ``--off`` disables retries, breakers and the
+concurrency limit for a baseline.
+
+    python -m bench.resilience --fakeredis --users 200
+    python -m bench.resilience --fakeredis --users 200 --off
+
+``--serve`` only starts the stub with the given faults, to point a running
+bot at (``API_URL``):
+
+    python -m bench.resilience --serve --port 8001 --error-rate 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+
+from bench.harness import Harness, configure
+
+# name, error rate, slow rate
+PHASES = (
+    ("healthy", 0.0, 0.0),
+    ("slow", 0.0, 0.3),
+    ("down", 1.0, 0.0),
+    ("recovered", 0.0, 0.0),
+)
+
+
+async def serve(args: argparse.Namespace) -> None:
+    from bench.stubs import StubApexID
+
+    stub = StubApexID(latency=args.api_latency / 1000)
+    stub.error_rate = args.error_rate
+    stub.slow_rate = args.slow_rate
+    stub.slow_latency = args.slow_latency
+
+    print(await stub.start(port=args.port))
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await stub.stop()
+
+
+async def main(args: argparse.Namespace, api_port: int) -> None:
+    from bot.core import api
+
+    async with Harness(args, api_port) as harness:
+        stub = harness.apexid
+        stub.slow_latency = args.slow_latency
+
+        for name, error_rate, slow_rate in PHASES:
+            stub.error_rate = error_rate
+            stub.slow_rate = slow_rate
+
+            before = api.stats()
+            failed = sum(stub.failed.values())
+            result = await harness.run("documents")
+            after = api.stats()
+
+            print(
+                json.dumps(
+                    {
+                        **result,
+                        "scenario": name,
+                        "failed_upstream": sum(stub.failed.values()) - failed,
+                        "short_circuited": after["short_circuited"]
+                        - before["short_circuited"],
+                        "retries": after["retries"] - before["retries"],
+                        "rejected": after["rejected"] - before["rejected"],
+                        "limit": round(after["limit"], 1),
+                        "open_breakers": after["open_breakers"],
+                    }
+                )
+            )
+
+            if name == "down":
+                # Until the breakers let a probe through
+                await asyncio.sleep(float(os.environ["API_BREAKER_RESET"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--api-latency", type=float, default=20, help="ms")
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="s")
+    parser.add_argument("--fakeredis", action="store_true")
+    parser.add_argument("--off", action="store_true")
+    parser.add_argument("--serve", action="store_true")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    if args.serve:
+        asyncio.run(serve(args))
+    else:
+        api_port = configure(args)
+        os.environ.update(
+            {
+                # Short enough to see the recovery within the run
+                "API_BREAKER_RESET": "2",
+                "API_TIMEOUT": str(args.slow_latency * 2),
+                **(
+                    {
+                        "API_RETRIES": "0",
+                        "API_BREAKER_THRESHOLD": str(10**9),
+                        "API_LIMIT_INITIAL": str(10**9),
+                        "API_LIMIT_MIN": str(10**9),
+                        "API_LIMIT_MAX": str(10**9),
+                    }
+                    if args.off
+                    else {}
+                ),
+            }
+        )
+        asyncio.run(main(args, api_port))
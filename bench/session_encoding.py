@@ -0,0 +1,136 @@
+"""
+Session encoding: the legacy JSON blob under the bare user id against the
+versioned msgpack value under a namespaced key with a TTL.
+
+Encode/decode cost and value size are measured in-process; with --redis the
+sessions are also written to REDIS_URL and the growth of ``used_memory`` is
+reported, which needs a real Redis (INFO). Keys use ids no Telegram user has
+and are deleted afterwards.
+
+    python -m bench.session_encoding --sessions 1000000 --redis
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+
+os.environ.setdefault("BOT_TOKEN", "0:bench")
+os.environ.setdefault("API_URL", "http://127.0.0.1:1")
+
+from bot.core import redis as store  # noqa: E402
+from bot.core.session import pack, unpack  # noqa: E402
+
+# Far above any real Telegram user id
+FIRST_ID = 9 * 10**12
+BATCH = 10_000
+
+
+def make_session(i: int) -> dict:
+    exp = int(time.time()) + 86400
+    claims = base64.urlsafe_b64encode(
+        json.dumps({"sub": f"{i:024x}", "exp": exp}).encode()
+    ).rstrip(b"=")
+
+    return {
+        "id": f"{i:024x}",
+        "email": f"user{i}@example.com",
+        "first_name": "Olena",
+        "token": f"eyJhbGciOiJIUzI1NiJ9.{claims.decode()}.{'s' * 43}",
+        "token_expires_at": float(exp),
+    }
+
+
+def encode_json(data: dict) -> bytes:
+    return bytes(json.dumps(data), "utf-8")
+
+
+def decode_json(raw: bytes) -> dict:
+    return json.loads(raw.decode("utf-8"))
+
+
+def codec(name: str, encode, decode, sessions: list[dict]) -> dict:
+    started = time.perf_counter()
+    encoded = [encode(data) for data in sessions]
+    encode_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for raw in encoded:
+        decode(raw)
+    decode_seconds = time.perf_counter() - started
+
+    return {
+        "format": name,
+        "sessions": len(sessions),
+        "encode_ns": round(encode_seconds / len(sessions) * 1e9),
+        "decode_ns": round(decode_seconds / len(sessions) * 1e9),
+        "avg_value_bytes": round(sum(map(len, encoded)) / len(encoded), 1),
+    }
+
+
+async def used_memory() -> int:
+    return (await store.r.info("memory"))["used_memory"]
+
+
+async def redis_memory(name: str, write, keys, sessions: list[dict]) -> dict:
+    before = await used_memory()
+
+    for offset in range(0, len(sessions), BATCH):
+        async with store.r.pipeline(transaction=False) as pipe:
+            for i in range(offset, min(offset + BATCH, len(sessions))):
+                write(pipe, FIRST_ID + i, sessions[i])
+            await pipe.execute()
+
+    after = await used_memory()
+
+    for offset in range(0, len(sessions), BATCH):
+        ids = range(FIRST_ID + offset, FIRST_ID + min(offset + BATCH, len(sessions)))
+        await store.r.delete(*(key for id in ids for key in keys(id)))
+
+    return {
+        "format": name,
+        "used_memory_mb": round((after - before) / 2**20, 1),
+        "bytes_per_session": round((after - before) / len(sessions)),
+    }
+
+
+def write_json(pipe, id: int, data: dict) -> None:
+    pipe.set(id, encode_json(data))
+
+
+def write_msgpack(pipe, id: int, data: dict) -> None:
+    pipe.set(store.session_key(id), pack(data), px=store._session_ttl(data))
+
+
+async def main(args: argparse.Namespace) -> None:
+    sessions = [make_session(i) for i in range(args.sessions)]
+
+    results = [
+        codec("json", encode_json, decode_json, sessions),
+        codec("msgpack v1", pack, unpack, sessions),
+    ]
+
+    if args.redis:
+        results += [
+            await redis_memory("json", write_json, lambda id: (id,), sessions),
+            await redis_memory(
+                "msgpack v1",
+                write_msgpack,
+                lambda id: (store.session_key(id),),
+                sessions,
+            ),
+        ]
+        await store.close()
+
+    for result in results:
+        print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=1_000_000)
+    parser.add_argument("--redis", action="store_true")
+
+    asyncio.run(main(parser.parse_args()))
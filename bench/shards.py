@@ -0,0 +1,143 @@
+"""
+Scaling of ``python -m bot.supervisor`` with the number of workers.
+
+Starts the supervisor with each ``--workers`` count against local stubs of
+the Bot API and ApexID, posts synthetic updates of distinct users to its
+webhook and measures updates/sec and the latency until the reply reaches the
+stub. ``photo`` updates carry a QR code and go through decoding, verification
+and document rendering; ``start`` is the bare dispatcher. Redis is the one
+from ``REDIS_URL``, or an in-process fakeredis server with ``--fakeredis``.
+
+    python -m bench.shards --fakeredis --workers 1 2 4 --scenario photo
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import aiohttp
+
+from bench.harness import free_port, percentile, qr_photo, start_fakeredis
+from bench.stubs import StubApexID, StubTelegram, message_update, photo_update
+from bench.webhook_polling import SECRET, TOKEN, start_bot, stop_bot
+
+
+def make_update(scenario: str, user_id: int) -> dict:
+    if scenario == "photo":
+        return photo_update(user_id, [("qr", 640, 640)])
+
+    return message_update(user_id, "/start")
+
+
+async def run(args: argparse.Namespace, workers: int) -> dict:
+    telegram = StubTelegram()
+    telegram.files["qr"] = qr_photo("%024x" % 0xC0DE, 640)
+    apexid = StubApexID(latency=args.api_latency / 1000)
+
+    bot_api_url = await telegram.start()
+    api_url = await apexid.start()
+    webhook_port = free_port()
+    webhook_url = f"http://127.0.0.1:{webhook_port}"
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        process = await start_bot(
+            {
+                "BOT_TOKEN": TOKEN,
+                "BOT_MODE": "webhook",
+                "BOT_API_URL": bot_api_url,
+                "API_URL": api_url,
+                "WEBHOOK_URL": webhook_url,
+                "WEBHOOK_HOST": "127.0.0.1",
+                "WEBHOOK_PORT": str(webhook_port),
+                "WEBHOOK_SECRET": SECRET,
+                "WORKERS": str(workers),
+                "METRICS_PORT": str(free_port()),
+                "NOTIFIER_ENABLED": "false",
+                "LOG_DIR": log_dir,
+                "LOG_CONSOLE": "false",
+                # The stub has no flood limits, measure the bot itself
+                "OUTBOX_GLOBAL_RATE": "1000000",
+                "OUTBOX_CHAT_RATE": "1000000",
+                "OUTBOX_CHAT_BURST": "1000000",
+            },
+            module="bot.supervisor",
+        )
+
+        async with aiohttp.ClientSession() as http:
+
+            async def one(user_id: int) -> float:
+                reply = telegram.expect_reply(user_id)
+                started = time.perf_counter()
+
+                while True:
+                    try:
+                        async with http.post(
+                            f"{webhook_url}/webhook",
+                            json=make_update(args.scenario, user_id),
+                            headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                        ) as response:
+                            response.raise_for_status()
+                            break
+                    except aiohttp.ClientConnectorError:
+                        # Still starting up
+                        await asyncio.sleep(0.1)
+
+                return await asyncio.wait_for(reply, 60) - started
+
+            # Every worker warmed up: users 1..workers land on distinct ones
+            await asyncio.wait_for(
+                asyncio.gather(*(one(i) for i in range(workers))), 120
+            )
+
+            slots = asyncio.Semaphore(args.concurrency)
+
+            async def bounded(user_id: int) -> float:
+                async with slots:
+                    return await one(user_id)
+
+            started = time.perf_counter()
+            latencies = await asyncio.gather(
+                *(bounded(1000 + i) for i in range(args.updates))
+            )
+            elapsed = time.perf_counter() - started
+
+        await stop_bot(process)
+
+    await telegram.stop()
+    await apexid.stop()
+
+    latencies = sorted(latencies)
+    return {
+        "scenario": args.scenario,
+        "workers": workers,
+        "updates": args.updates,
+        "concurrency": args.concurrency,
+        "updates_per_sec": round(args.updates / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+        "cpus": os.cpu_count(),
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    for workers in args.workers:
+        print(json.dumps(await run(args, workers)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--scenario", choices=("start", "photo"), default="photo")
+    parser.add_argument("--updates", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--api-latency", type=float, default=20, help="ms")
+    parser.add_argument("--fakeredis", action="store_true")
+    args = parser.parse_args()
+
+    if args.fakeredis:
+        os.environ["REDIS_URL"] = start_fakeredis()
+
+    asyncio.run(main(args))
@@ -0,0 +1,133 @@
+"""
+Startup time of ``python -m bot``.
+
+Reports where import time goes, per top-level package (``-X importtime``),
+then starts the bot against a local Bot API stub with an update already
+queued, several times, and reports the phases it logs with STARTUP_PROFILE
+along with the time from spawning the process to its reply. Needs a local
+Redis (``REDIS_URL``).
+
+    python -m bench.startup --runs 5
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from bench.harness import free_port
+from bench.stubs import StubTelegram, message_update
+from bench.webhook_polling import TOKEN, start_bot, stop_bot
+
+IMPORT_TIME = re.compile(r"import time:\s+(\d+) \|\s+\d+ \|(\s+)(\S+)")
+LAZY = ("PIL", "pyzbar", "qrcode")
+
+
+def import_breakdown(top: int) -> dict:
+    env = {**os.environ, "BOT_TOKEN": TOKEN, "API_URL": "http://127.0.0.1:1"}
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import bot.__main__"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+
+    packages: Counter[str] = Counter()
+
+    for match in IMPORT_TIME.finditer(stderr):
+        packages[match[3].split(".")[0]] += int(match[1])
+
+    return {
+        "imports_ms": round(sum(packages.values()) / 1000, 1),
+        "top_packages_ms": {
+            name: round(us / 1000, 1) for name, us in packages.most_common(top)
+        },
+        "lazy_loaded": [name for name in LAZY if name in packages],
+    }
+
+
+def read_phases(log_dir: str) -> dict:
+    phases = {}
+
+    with open(os.path.join(log_dir, "bot.log")) as file:
+        for line in file:
+            record = json.loads(line)
+            phases.update(
+                {
+                    key: record[key]
+                    for key in ("imports", "startup", "first_update")
+                    if key in record
+                }
+            )
+
+    return phases
+
+
+async def first_update(env: dict) -> dict:
+    stub = StubTelegram()
+    api_url = await stub.start()
+    reply = stub.expect_reply(1)
+    stub.push(message_update(1, "/start"))
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        started = time.perf_counter()
+        process = await start_bot(
+            {
+                "BOT_TOKEN": TOKEN,
+                "BOT_API_URL": api_url,
+                "API_URL": "http://127.0.0.1:1",
+                "METRICS_PORT": str(free_port()),
+                "NOTIFIER_ENABLED": "false",
+                "STARTUP_PROFILE": "true",
+                "LOG_DIR": log_dir,
+                "LOG_CONSOLE": "false",
+                **env,
+            }
+        )
+
+        try:
+            spawn_to_reply = await asyncio.wait_for(reply, 60) - started
+        finally:
+            await stop_bot(process)
+            await stub.stop()
+
+        return {"spawn_to_reply": spawn_to_reply, **read_phases(log_dir)}
+
+
+async def main(args: argparse.Namespace) -> None:
+    print(json.dumps(import_breakdown(args.top)))
+
+    env = {"QR_PREWARM": "true" if args.prewarm else "false"}
+    runs = [await first_update(env) for _ in range(args.runs)]
+
+    print(
+        json.dumps(
+            {
+                "runs": args.runs,
+                "qr_prewarm": args.prewarm,
+                **{
+                    f"{key}_ms_p50": round(
+                        statistics.median(run[key] for run in runs) * 1000, 1
+                    )
+                    for key in runs[0]
+                },
+            }
+        )
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--prewarm", action="store_true")
+
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,398 @@
+"""Local stand-ins for the Telegram Bot API and the ApexID API."""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import TelegramMethod
+from aiohttp import web
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> dict:
+    return {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+
+
+def _chat(user_id: int) -> dict:
+    return {"id": user_id, "type": "private", "first_name": f"User {user_id}"}
+
+
+def message_update(user_id: int, text: str) -> dict:
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": _chat(user_id),
+        "from": _user(user_id),
+        "text": text,
+    }
+
+    if text.startswith("/"):
+        command = text.split()[0]
+        message["entities"] = [
+            {"type": "bot_command", "offset": 0, "length": len(command)}
+        ]
+
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def photo_update(
+    user_id: int,
+    sizes: list[tuple[str, int, int]],
+    media_group_id: str | None = None,
+) -> dict:
+    message = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": _chat(user_id),
+        "from": _user(user_id),
+        "photo": [
+            {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "width": width,
+                "height": height,
+            }
+            for file_id, width, height in sizes
+        ],
+    }
+
+    if media_group_id is not None:
+        message["media_group_id"] = media_group_id
+
+    return {"update_id": next(_update_ids), "message": message}
+
+
+def callback_update(user_id: int, data: str, message_id: int | None = None) -> dict:
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": _user(user_id),
+            "chat_instance": str(user_id),
+            "data": data,
+            "message": {
+                "message_id": message_id or next(_message_ids),
+                "date": int(time.time()),
+                "chat": _chat(user_id),
+                "from": {"id": 1, "is_bot": True, "first_name": "bench"},
+                "text": "Please select the document you want to get:",
+            },
+        },
+    }
+
+
+class StubTelegram:
+    """
+    Minimal Bot API server: serves queued updates to ``getUpdates``, accepts
+    every outgoing call and lets the benchmark wait for the bot's reply to a
+    given chat.
+    """
+
+    REPLIES = {"sendmessage", "editmessagetext", "sendphoto"}
+
+    def __init__(self) -> None:
+        self.updates: list[dict] = []
+        self.files: dict[str, bytes] = {}
+        self.calls: Counter[str] = Counter()
+        self._has_updates = asyncio.Event()
+        self._waiters: dict[int, asyncio.Future] = {}
+        self._runner: web.AppRunner | None = None
+
+        self.app = web.Application()
+        self.app.router.add_post("/bot{token}/{method}", self._api)
+        self.app.router.add_get("/file/bot{token}/{path:.*}", self._file)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def push(self, update: dict) -> None:
+        self.updates.append(update)
+        self._has_updates.set()
+
+    def expect_reply(self, chat_id: int) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._waiters[chat_id] = future
+        return future
+
+    async def _api(self, request: web.Request) -> web.Response:
+        result = await self.call(
+            request.match_info["method"], dict(await request.post())
+        )
+
+        return web.json_response({"ok": True, "result": result})
+
+    async def call(self, method: str, params: dict) -> Any:
+        method = method.lower()
+        self.calls[method] += 1
+
+        if method == "getupdates":
+            result = await self._get_updates(params)
+        elif method == "getme":
+            result = {
+                "id": 1,
+                "is_bot": True,
+                "first_name": "bench",
+                "username": "bench_bot",
+            }
+        elif method == "getfile":
+            file_id = params["file_id"]
+            result = {
+                "file_id": file_id,
+                "file_unique_id": file_id,
+                "file_path": file_id,
+            }
+        elif method in self.REPLIES:
+            result = self._reply(method, params)
+        else:
+            result = True
+
+        return result
+
+    async def _file(self, request: web.Request) -> web.Response:
+        return web.Response(body=self.files[request.match_info["path"]])
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset", 0))
+        self.updates = [
+            update for update in self.updates if update["update_id"] >= offset
+        ]
+
+        if not self.updates:
+            self._has_updates.clear()
+
+            try:
+                await asyncio.wait_for(
+                    self._has_updates.wait(), float(params.get("timeout", 0))
+                )
+            except asyncio.TimeoutError:
+                return []
+
+        return self.updates[: int(params.get("limit", 100))]
+
+    def _reply(self, method: str, params: dict) -> dict:
+        chat_id = int(params["chat_id"])
+
+        waiter = self._waiters.pop(chat_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(time.perf_counter())
+
+        message = {
+            "message_id": int(params.get("message_id") or next(_message_ids)),
+            "date": int(time.time()),
+            "chat": _chat(chat_id),
+            "from": {"id": 1, "is_bot": True, "first_name": "bench"},
+        }
+
+        if method == "sendphoto":
+            file_id = f"photo{message['message_id']}"
+            message["photo"] = [
+                {
+                    "file_id": file_id,
+                    "file_unique_id": file_id,
+                    "width": 320,
+                    "height": 320,
+                }
+            ]
+        else:
+            message["text"] = params.get("text", "")
+
+        return message
+
+
+class FakeSession(BaseSession):
+    """Bot session answering from a ``StubTelegram`` in-process, without HTTP."""
+
+    PARAMS = ("chat_id", "message_id", "text", "file_id")
+
+    def __init__(self, stub: StubTelegram) -> None:
+        super().__init__()
+        self.stub = stub
+
+    async def make_request(
+        self, bot: Bot, method: TelegramMethod, timeout: int | None = None
+    ) -> Any:
+        params = {
+            name: getattr(method, name)
+            for name in self.PARAMS
+            if getattr(method, name, None) is not None
+        }
+        result = await self.stub.call(method.__api_method__, params)
+
+        response = self.check_response(
+            bot, method, 200, json.dumps({"ok": True, "result": result})
+        )
+        return response.result
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        # .../file/bot<token>/<path>
+        yield self.stub.files[url.split("/file/bot", 1)[1].split("/", 1)[1]]
+
+    async def close(self) -> None:
+        pass
+
+
+class StubApexID:
+    """
+    ApexID API returning canned data after ``latency`` seconds. Tokens are
+    ``token-<email>``; ``documents`` documents of ``fields`` fields each.
+
+    Faults can be injected at any time: ``error_rate`` of the calls answer
+    503, ``slow_rate`` of them take ``slow_latency`` seconds more.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        documents: int = 5,
+        notifications: int = 50,
+        fields: int = 20,
+    ) -> None:
+        self.latency = latency
+        self.error_rate = 0.0
+        self.slow_rate = 0.0
+        self.slow_latency = 5.0
+        self.calls: Counter[str] = Counter()
+        self.failed: Counter[str] = Counter()
+        self.documents = [self._document(i, fields) for i in range(documents)]
+        self.notifications = [
+            {
+                "_id": "%024x" % i,
+                "user_id": "bench",
+                "message": f"Notification {i}",
+                "created_at": f"2024-02-{i % 28 + 1:02d}T{i % 24:02d}:00:00.000000Z",
+                "created_by": "system",
+                "metadata": {},
+            }
+            for i in range(notifications)
+        ]
+        self._runner: web.AppRunner | None = None
+
+        self.app = web.Application()
+        base = "/api/v1"
+        self.app.router.add_post(f"{base}/public/authorization/signin", self._signin)
+        self.app.router.add_post(f"{base}/public/authorization/signup", self._signup)
+        self.app.router.add_get(f"{base}/private/profile/my", self._profile)
+        self.app.router.add_get(
+            f"{base}/private/profile/my/notifications", self._notifications
+        )
+        self.app.router.add_get(f"{base}/private/application/cabinet", self._cabinet)
+        self.app.router.add_get(f"{base}/private/profile/my/documents", self._documents)
+        self.app.router.add_get(
+            f"{base}/private/profile/my/documents/{{id}}", self._document_detail
+        )
+        self.app.router.add_get(
+            f"{base}/private/profile/my/documents/{{id}}/confirm", self._confirm
+        )
+        self.app.router.add_get(f"{base}/public/document/verify/{{code}}", self._verify)
+
+    @staticmethod
+    def _document(i: int, fields: int) -> dict:
+        data = {f"field_number_{n}": f"value {n}" for n in range(fields)}
+        data["born"] = {"place": "Somewhere", "date": "2000-01-01"}
+
+        return {
+            "_id": "%024x" % (0xD0C000 + i),
+            "metadata": {"document_name": f"Document {i}"},
+            "data": data,
+        }
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+
+        port = site._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{port}"
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _respond(self, name: str, data: Any, status: int = 200) -> web.Response:
+        self.calls[name] += 1
+
+        if self.latency:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+        if random.random() < self.slow_rate:
+            await asyncio.sleep(self.slow_latency)
+
+        if random.random() < self.error_rate:
+            self.failed[name] += 1
+            return web.json_response({"detail": "Injected fault"}, status=503)
+
+        return web.json_response(data, status=status)
+
+    @staticmethod
+    def _authorized(request: web.Request) -> bool:
+        return request.headers.get("Authorization", "").startswith("token-")
+
+    async def _signin(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        return await self._respond("login", {"token": f"token-{body['email']}"})
+
+    async def _signup(self, request: web.Request) -> web.Response:
+        return await self._respond("register", {})
+
+    async def _private(self, name: str, request: web.Request, data: Any):
+        if not self._authorized(request):
+            return await self._respond(name, {"detail": "Unauthorized"}, 401)
+
+        return await self._respond(name, data)
+
+    async def _profile(self, request: web.Request) -> web.Response:
+        email = request.headers["Authorization"].removeprefix("token-")
+        data = {"id": email, "first_name": "Bench"}
+        return await self._private("get_profile", request, data)
+
+    async def _notifications(self, request: web.Request) -> web.Response:
+        return await self._private("get_notifications", request, self.notifications)
+
+    async def _cabinet(self, request: web.Request) -> web.Response:
+        data = [{"reference": "REF_bench", "status": "approved"}]
+        return await self._private("cabinet", request, data)
+
+    async def _documents(self, request: web.Request) -> web.Response:
+        data = [{k: d[k] for k in ("_id", "metadata")} for d in self.documents]
+        return await self._private("get_documets", request, data)
+
+    async def _document_detail(self, request: web.Request) -> web.Response:
+        by_id = {d["_id"]: d for d in self.documents}
+        return await self._private(
+            "get_document", request, by_id.get(request.match_info["id"], {})
+        )
+
+    async def _confirm(self, request: web.Request) -> web.Response:
+        data = {"token": "%024x" % random.getrandbits(96)}
+        return await self._private("request_verification_code", request, data)
+
+    async def _verify(self, request: web.Request) -> web.Response:
+        return await self._respond("verify_code", self.documents[0]["data"])
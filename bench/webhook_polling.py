@@ -0,0 +1,133 @@
+"""
+Long polling versus webhook throughput.
+
+Starts ``python -m bot`` against a local Bot API stub in each mode, feeds it
+synthetic ``/start`` updates (through ``getUpdates`` or by posting to the
+webhook) and measures updates/sec and the latency until the bot's reply
+reaches the stub. Needs a local Redis (``REDIS_URL``).
+
+    python -m bench.webhook_polling --updates 2000 --concurrency 100
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import sys
+import time
+
+import aiohttp
+
+from bench.harness import percentile
+from bench.stubs import StubTelegram, message_update
+
+TOKEN = "42:bench"
+SECRET = "bench-secret"
+
+
+async def start_bot(env: dict, module: str = "bot") -> asyncio.subprocess.Process:
+    return await asyncio.create_subprocess_exec(
+        sys.executable, "-m", module, env={**os.environ, **env}
+    )
+
+
+async def stop_bot(process: asyncio.subprocess.Process) -> None:
+    process.send_signal(signal.SIGTERM)
+
+    try:
+        await asyncio.wait_for(process.wait(), 30)
+    except asyncio.TimeoutError:
+        process.kill()
+
+
+async def run_mode(
+    mode: str, updates: int, concurrency: int, webhook_port: int
+) -> dict:
+    stub = StubTelegram()
+    api_url = await stub.start()
+    webhook_url = f"http://127.0.0.1:{webhook_port}"
+
+    process = await start_bot(
+        {
+            "BOT_TOKEN": TOKEN,
+            "BOT_MODE": mode,
+            "BOT_API_URL": api_url,
+            "API_URL": os.environ.get("API_URL", "http://127.0.0.1:1"),
+            "WEBHOOK_URL": webhook_url,
+            "WEBHOOK_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": str(webhook_port),
+            "WEBHOOK_SECRET": SECRET,
+            # The stub has no flood limits, measure the bot rather than the outbox
+            "OUTBOX_GLOBAL_RATE": os.environ.get("OUTBOX_GLOBAL_RATE", "1000000"),
+        }
+    )
+
+    async with aiohttp.ClientSession() as http:
+
+        async def deliver(update: dict) -> None:
+            if mode == "polling":
+                stub.push(update)
+                return
+
+            while True:
+                try:
+                    async with http.post(
+                        f"{webhook_url}/webhook",
+                        json=update,
+                        headers={"X-Telegram-Bot-Api-Secret-Token": SECRET},
+                    ) as response:
+                        response.raise_for_status()
+                        return
+                except aiohttp.ClientConnectorError:
+                    # Server is still starting up
+                    await asyncio.sleep(0.1)
+
+        async def one(user_id: int) -> float:
+            reply = stub.expect_reply(user_id)
+            started = time.perf_counter()
+            await deliver(message_update(user_id, "/start"))
+            return await asyncio.wait_for(reply, 30) - started
+
+        await asyncio.wait_for(one(1), 60)
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def bounded(user_id: int) -> float:
+            async with semaphore:
+                return await one(user_id)
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(bounded(1000 + i) for i in range(updates)))
+        elapsed = time.perf_counter() - started
+
+    await stop_bot(process)
+    await stub.stop()
+
+    latencies = sorted(latencies)
+    return {
+        "mode": mode,
+        "updates": updates,
+        "concurrency": concurrency,
+        "updates_per_sec": round(updates / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 1),
+    }
+
+
+async def main(updates: int, concurrency: int, webhook_port: int) -> None:
+    results = [
+        await run_mode(mode, updates, concurrency, webhook_port)
+        for mode in ("polling", "webhook")
+    ]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--webhook-port", type=int, default=8089)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.updates, args.concurrency, args.webhook_port))
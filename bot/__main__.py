@@ -1,33 +1,82 @@
+import time
+
+# Before anything else is imported, see STARTUP_PROFILE
+STARTED = time.perf_counter()
+
 import asyncio
-import datetime
 import io
-import qrcode
 import logging
-from PIL.Image import Image
-from PIL import Image as PImage
-from pyzbar.pyzbar import decode
-import re
-from bot.core.decorators.user import authorization_required
-from bot.core import api
+import math
+import multiprocessing.queues
+from bot.core.decorators.user import SESSION_EXPIRED, authorization_required, reply
+from bot.core import (
+    api,
+    documents,
+    log,
+    metrics,
+    notifications,
+    qr,
+    responses,
+    verification,
+)
 from bot.core.config import settings
-from bot.core.redis import is_user_exist, set_user, get_user, logout
-from aiogram.fsm.storage.memory import MemoryStorage
+from bot.core import redis
+from bot.core.notifier import notification_poller
+from bot.core.outbox import outbox
+from bot.core.redis import set_user, logout, toggle_subscription
+from bot.core.scheduler import deletion_scheduler, schedule_deletion
+from bot.core.session import Session
+from bot.core.startup import StartupProfiler
+from bot.core.storage import create_storage
+from bot.core.text import split_message
+from bot.core.tokens import TokenState, expires_at, token_manager
+from bot.core.webhook import run_webhook, run_worker
+from bot.core.middlewares.log_context import (
+    HandlerLogContextMiddleware,
+    UpdateLogContextMiddleware,
+)
+from bot.core.middlewares.metrics import MetricsMiddleware
+from bot.core.middlewares.serialization import SerializationMiddleware
+from bot.core.middlewares.session import SessionMiddleware
+import aiohttp
 from aiogram import F, Bot, Dispatcher, Router, types, Router
 from aiogram.fsm.context import FSMContext
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
-from aiogram.filters import CommandStart, Command
+from aiogram.filters import CommandStart, Command, ExceptionTypeFilter
 from aiogram.types import Message
 from aiogram.utils.markdown import hbold
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.fsm.state import State, StatesGroup
 
+startup_profiler = StartupProfiler(STARTED)
+startup_profiler.mark("imports")
+
 TOKEN = settings.BOT_TOKEN
 
 form_router = Router()
-storage = MemoryStorage()
+storage = create_storage()
 dp = Dispatcher(storage=storage)
 
+dp.update.outer_middleware(UpdateLogContextMiddleware())
+
+serialization_middleware = SerializationMiddleware(
+    dedup_window=settings.CALLBACK_DEDUP_WINDOW
+)
+dp.update.outer_middleware(serialization_middleware)
+dp.message.middleware(HandlerLogContextMiddleware())
+dp.callback_query.middleware(HandlerLogContextMiddleware())
+
+metrics_middleware = MetricsMiddleware()
+dp.message.middleware(metrics_middleware)
+dp.callback_query.middleware(metrics_middleware)
+
+session_middleware = SessionMiddleware()
+dp.message.middleware(session_middleware)
+dp.callback_query.middleware(session_middleware)
+
 
 class LoginState(StatesGroup):
     email = State()
@@ -47,7 +96,7 @@ class RegisterState(StatesGroup):
 
 
 @dp.message(CommandStart())
-async def command_start_handler(message: Message) -> None:
+async def command_start_handler(message: Message, session: Session | None) -> None:
 
     parts = [
         f"Hello, {hbold(message.from_user.full_name)}!",
@@ -57,7 +106,7 @@ async def command_start_handler(message: Message) -> None:
         ),
         (
             "I see that you already authorized, you can use /help to get more information"
-            if is_user_exist(message.from_user.id)
+            if session is not None
             else "You are not authorized yet. Please, /login or /register."
         ),
     ]
@@ -66,13 +115,16 @@ async def command_start_handler(message: Message) -> None:
 
 @dp.message(Command("logout"))
 async def logout_handler(message: Message) -> None:
-    logout(message.from_user.id)
+    await logout(message.from_user.id)
     await message.answer("You have been successfully logged out!")
 
 
 @dp.message(Command("login"))
-async def login_handler(message: Message, state: FSMContext) -> None:
-    if is_user_exist(message.from_user.id):
+async def login_handler(
+    message: Message, state: FSMContext, session: Session | None
+) -> None:
+    # An expiring session may log in again to renew its token
+    if session is not None and token_manager.state(session) is TokenState.VALID:
         await message.answer("You are already authorized!")
         return
 
@@ -96,7 +148,7 @@ async def login_password_handler(message: Message, state: FSMContext) -> None:
     await state.clear()
 
     # TODO: add more details about the client as metadata
-    _response = api.login(data.get("email"), message.text)
+    _response = await api.login(data.get("email"), message.text)
 
     if _response.status_code != 200:
         await message.answer(
@@ -112,9 +164,16 @@ async def login_password_handler(message: Message, state: FSMContext) -> None:
         )
         return
 
-    profile_response = api.get_profile(auth_data.get("token"))
+    # The endpoints users open next are fetched along with the profile
+    try:
+        profile_response, prefetched = await responses.prefetch(
+            auth_data.get("token"), settings.LOGIN_PREFETCH_TIMEOUT
+        )
+    except api.Unauthorized:
+        # Signed in a moment ago, not an expired session: the profile failed
+        profile_response = None
 
-    if profile_response.status_code != 200:
+    if profile_response is None or profile_response.status_code != 200:
         await message.answer(
             "Something went wrong while fetching your profile. Please, try again.",
         )
@@ -122,24 +181,40 @@ async def login_password_handler(message: Message, state: FSMContext) -> None:
 
     profile_data = profile_response.json()
 
-    set_user(
+    await set_user(
         message.from_user.id,
         {
             "id": profile_data.get("id"),
             "email": data.get("email"),
             "first_name": profile_data.get("first_name"),
             "token": auth_data.get("token"),
+            "token_expires_at": expires_at(auth_data.get("token")),
         },
     )
+    responses.warm_up(message.from_user.id, auth_data.get("token"), prefetched)
 
-    await message.answer(
-        f"Welcome to the system, {hbold(profile_data.get('first_name'))}!"
-    )
+    parts = [f"Welcome to the system, {hbold(profile_data.get('first_name'))}!"]
+
+    if "notifications" in prefetched:
+        unseen = notifications.newer_than(
+            prefetched["notifications"].json() or [],
+            await notifications.get_mark(notifications.SEEN_KEY, message.from_user.id),
+        )
+
+        if unseen:
+            parts.append(
+                f"You have {len(unseen)} new notifications, see /notifications."
+            )
+
+    await message.answer("\n".join(parts))
 
 
 @dp.message(Command("register"))
-async def register_handler(message: Message, state: FSMContext) -> None:
-    if is_user_exist(message.from_user.id):
+async def register_handler(
+    message: Message, state: FSMContext, session: Session | None
+) -> None:
+    # An expiring session may log in again to renew its token
+    if session is not None and token_manager.state(session) is TokenState.VALID:
         await message.answer("You are already authorized!")
         return
 
@@ -222,13 +297,13 @@ async def register_born_date_handler(message: Message, state: FSMContext) -> Non
     data = await state.get_data()
     await state.clear()
 
-    _response = api.register(data)
+    _response = await api.register(data)
 
     if _response.status_code != 200:
         await message.answer(
             "Something went wrong. Please, try again.",
         )
-        print(_response.json())
+        logging.warning("Registration failed: %s", _response.content)
         return
 
     await message.answer(
@@ -262,9 +337,8 @@ async def cancel_handler(message: Message, state: FSMContext) -> None:
 
 @dp.message(Command("profile"))
 @authorization_required
-async def profile_handler(message: Message) -> None:
-    token = get_user(message.from_user.id).get("token")
-    profile_response = api.get_profile(token)
+async def profile_handler(message: Message, session: Session) -> None:
+    profile_response = await api.get_profile(session.token)
 
     if profile_response.status_code != 200:
         await message.answer(
@@ -286,10 +360,50 @@ async def profile_handler(message: Message) -> None:
     await message.answer("\n".join(parts))
 
 
+def notifications_page(
+    notifications_data: list[dict], page: list[dict], header: str
+) -> tuple[str, types.InlineKeyboardMarkup | None]:
+    parts = [header]
+
+    for notification in page:
+        parts.append(notifications.format_notification(notification))
+
+    parts.append(
+        f"Total {hbold(len(notifications_data))} notifications.\nUse '/notifications all' to see all of them or '/notifications new' for the unread ones."
+    )
+
+    # Pages are addressed by the id of their first/last notification
+    builder = InlineKeyboardBuilder()
+
+    if notifications.sort_key(page[0]) < notifications.sort_key(
+        max(notifications_data, key=notifications.sort_key)
+    ):
+        builder.add(
+            types.InlineKeyboardButton(
+                text="« Newer",
+                callback_data=f"notifications_newer_{page[0].get('_id')}",
+            )
+        )
+
+    if notifications.sort_key(page[-1]) > notifications.sort_key(
+        min(notifications_data, key=notifications.sort_key)
+    ):
+        builder.add(
+            types.InlineKeyboardButton(
+                text="Older »",
+                callback_data=f"notifications_older_{page[-1].get('_id')}",
+            )
+        )
+
+    return "\n".join(parts), builder.as_markup() if list(builder.buttons) else None
+
+
 @dp.message(Command("notifications"))
-async def notifications_handler(message: Message) -> None:
-    token = get_user(message.from_user.id).get("token")
-    notifications_response = api.get_notifications(token)
+@authorization_required
+async def notifications_handler(message: Message, session: Session) -> None:
+    notifications_response = await responses.get_notifications(
+        message.from_user.id, session.token
+    )
 
     if notifications_response.status_code != 200:
         await message.answer(
@@ -303,57 +417,106 @@ async def notifications_handler(message: Message) -> None:
         await message.answer("You don't have any notifications.")
         return
 
-    parts = [
-        f"Your notifications:\n",
-    ]
+    mode = message.text.split()[1] if len(message.text.split()) > 1 else None
 
-    """
-    {
-		"_id": "65ce9227ac91b58fd40c91bd",
-		"user_id": "65ce28267e6a49005d3f5c5d",
-		"message": "New device signed in to your account, DeviceID: 65ce9227ac91b58fd40c91bc",
-		"created_at": "2024-02-15T22:37:27.535000",
-		"created_by": "system",
-		"metadata": {}
-	},
-    """
+    last_seen = await notifications.get_mark(
+        notifications.SEEN_KEY, message.from_user.id
+    )
+    unseen = notifications.newer_than(notifications_data, last_seen)
 
-    total_notifications = len(notifications_data)
+    if unseen:
+        await notifications.set_mark(
+            notifications.SEEN_KEY,
+            message.from_user.id,
+            notifications.sort_key(max(unseen, key=notifications.sort_key)),
+        )
 
-    limit = 5
-    if len(message.text.split()) > 1:
-        if message.text.split()[1] == "all":
-            limit = total_notifications
+    if mode in ("all", "new"):
+        selected = notifications_data if mode == "all" else unseen
 
-    notifications_data = sorted(
-        notifications_data, key=lambda x: x.get("created_at"), reverse=True
-    )[:limit]
+        if not selected:
+            await message.answer("You don't have any new notifications.")
+            return
 
-    for notification in notifications_data:
-        datetime_object = datetime.datetime.fromisoformat(
-            notification.get("created_at")[:-1]
-        )
+        parts = [
+            f"Your notifications:\n",
+            *map(
+                notifications.format_notification,
+                sorted(selected, key=notifications.sort_key, reverse=True),
+            ),
+            f"Total {hbold(len(selected))} notifications are shown.",
+        ]
 
-        formated_time = datetime_object.strftime("%Y-%m-%d %H:%M:%S")
+        for chunk in split_message(parts):
+            await message.answer(chunk)
+        return
 
-        parts.append(
-            f"{notification.get('message')}\n{hbold(formated_time)} from {hbold(notification.get('created_by'))}\n"
-        )
+    text, reply_markup = notifications_page(
+        notifications_data,
+        notifications.latest(notifications_data, settings.NOTIFICATIONS_PAGE_SIZE),
+        f"Your notifications ({hbold(len(unseen))} new since last time):\n",
+    )
 
-    if total_notifications > limit:
-        parts.append(
-            f"Only {hbold(limit)} latest notifications are shown.\nUse '/notifications all' to see all of them."
-        )
+    await message.answer(text, reply_markup=reply_markup)
+
+
+@dp.callback_query(F.data.startswith("notifications_"))
+@authorization_required
+async def notifications_page_handler(
+    query: types.CallbackQuery, session: Session
+) -> None:
+    _, direction, cursor = query.data.split("_")
+    notifications_response = await responses.get_notifications(
+        query.from_user.id, session.token
+    )
+
+    if notifications_response.status_code != 200:
+        await reply(query, "Something went wrong while fetching your notifications.")
+        return
+
+    notifications_data = notifications_response.json()
+
+    if not notifications_data:
+        await query.message.edit_text("You don't have any notifications.")
+        return
+
+    limit = settings.NOTIFICATIONS_PAGE_SIZE
+    key = notifications.find_key(notifications_data, cursor)
+
+    if key is None:
+        # The cursor is gone from the list, start over from the latest
+        page = notifications.latest(notifications_data, limit)
+    elif direction == "older":
+        page = notifications.latest(notifications_data, limit, older_than=key)
     else:
-        parts.append(f"Total {hbold(total_notifications)} notifications are shown.")
+        page = notifications.previous(notifications_data, limit, newer_than=key)
 
-    await message.answer("\n".join(parts))
+    if not page:
+        page = notifications.latest(notifications_data, limit)
+
+    text, reply_markup = notifications_page(
+        notifications_data, page, "Your notifications:\n"
+    )
+
+    await query.message.edit_text(text, reply_markup=reply_markup)
+
+
+@dp.message(Command("subscribe"))
+@authorization_required
+async def subscribe_handler(message: Message, session: Session) -> None:
+    if await toggle_subscription(message.from_user.id):
+        await message.answer(
+            "You will receive new notifications as they arrive.\nUse /subscribe again to stop."
+        )
+        return
+
+    await message.answer("You will no longer receive new notifications.")
 
 
 @dp.message(Command("cabinet"))
-async def cabinet_handler(message: Message) -> None:
-    token = get_user(message.from_user.id).get("token")
-    cabinet_response = api.cabinet(token)
+@authorization_required
+async def cabinet_handler(message: Message, session: Session) -> None:
+    cabinet_response = await responses.cabinet(message.from_user.id, session.token)
 
     if cabinet_response.status_code != 200:
         await message.answer(
@@ -387,9 +550,11 @@ async def cabinet_handler(message: Message) -> None:
 
 
 @dp.message(Command("documents"))
-async def documents_handler(message: Message) -> None:
-    token = get_user(message.from_user.id).get("token")
-    documents_response = api.get_documets(token)
+@authorization_required
+async def documents_handler(message: Message, session: Session) -> None:
+    documents_response = await responses.get_documets(
+        message.from_user.id, session.token
+    )
 
     if documents_response.status_code != 200:
         await message.answer(
@@ -418,32 +583,86 @@ async def documents_handler(message: Message) -> None:
     )
 
 
-def image_to_byte_array(image: Image):
-    imgByteArr = io.BytesIO()
-    image.save(imgByteArr, format=image.format)
-    imgByteArr = imgByteArr.getvalue()
-    return imgByteArr
+async def decode_photo(bot: Bot, photo: types.PhotoSize) -> list[str]:
+    image_file = io.BytesIO()
+    await bot.download(photo.file_id, image_file)
+
+    return await qr.decode(image_file.getvalue())
+
+
+async def decode_message(message: Message) -> list[str]:
+    photo = qr.pick_photo_size(message.photo)
+    decoded_data = await decode_photo(message.bot, photo)
+
+    if not decoded_data and photo is not message.photo[-1]:
+        decoded_data = await decode_photo(message.bot, message.photo[-1])
+
+    return decoded_data
+
+
+media_groups = verification.MediaGroupCollector(settings.MEDIA_GROUP_WINDOW)
 
 
 @dp.message(F.photo)
 async def photo_handler(message: types.Message) -> None:
-    image_file = io.BytesIO()
-    await message.bot.download(message.photo[-1].file_id, image_file)
-    img = PImage.open(image_file)
+    messages = [message]
+
+    if message.media_group_id is not None:
+        messages = await media_groups.collect(message)
+
+        # Another photo of the album handles it
+        if messages is None:
+            return
+
+    # Before downloading anything: a flood is cut off here
+    admitted = verification.scan_limiter.admit(message.from_user.id, len(messages))
+
+    if admitted < len(messages) and verification.scan_limiter.should_warn(
+        message.from_user.id
+    ):
+        wait = math.ceil(verification.scan_limiter.retry_after(message.from_user.id))
+        await message.answer(
+            f"You are scanning too fast, {len(messages) - admitted} photos were "
+            f"skipped. Try again in {wait} seconds."
+        )
 
-    decoded_data = decode(img)
+    if not admitted:
+        return
+
+    messages = messages[:admitted]
+
+    try:
+        decoded = await asyncio.gather(*map(decode_message, messages))
+    except qr.QueueFull:
+        await message.answer("Too many QR codes are being checked, try again later.")
+        return
+
+    symbols = [symbol for symbols in decoded for symbol in symbols]
 
-    if not decoded_data:
+    if not symbols:
         await message.answer("No QR code detected.")
         return
 
-    qr_code_data = decoded_data[0].data.decode("utf-8")
+    codes = list(dict.fromkeys(filter(verification.is_code, symbols)))
 
-    if not re.match(r"^[a-f\d]{24}$", qr_code_data):
+    if not codes:
         await message.answer("Invalid QR code.")
         return
 
-    verification_response = api.verify_code(qr_code_data)
+    if len(codes) > 1:
+        results = await verification.verify_all(codes)
+
+        rejected = sum(not verification.is_code(symbol) for symbol in symbols)
+
+        for text in verification.summary(results, rejected):
+            _m = await message.answer(text)
+            await schedule_deletion(_m.chat.id, _m.message_id, 180)
+
+        return
+
+    qr_code_data = codes[0]
+
+    verification_response = await verification.verification_cache.get(qr_code_data)
 
     if verification_response.status_code != 200:
         _response_data = verification_response.json()
@@ -453,31 +672,24 @@ async def photo_handler(message: types.Message) -> None:
             )
         return await message.answer("Verification failed.")
 
-    document_data = verification_response.json()
-
-    parts = [
-        # f"{hbold(document_data.get('document_name'))}",
-    ]
-
-    for key, value in document_data.items():
-        parts.append(f"\n{key.replace('_', ' ').capitalize()}\n{hbold(value)}\n")
-
-    parts.append(
-        "Document is valid and verified.\nThis message will be deleted in 3 minutes."
-    )
-
-    _m = await message.answer("\n".join(parts))
-
-    await asyncio.sleep(180)
-
-    await _m.delete()
+    for text in documents.render(
+        verification_response.json(),
+        footer="Document is valid and verified.\n"
+        "This message will be deleted in 3 minutes.",
+    ):
+        _m = await message.answer(text)
+        await schedule_deletion(_m.chat.id, _m.message_id, 180)
 
 
 @dp.callback_query(F.data.startswith("verification_"))
-async def verification_code_handler(query: types.CallbackQuery) -> None:
+@authorization_required
+async def verification_code_handler(
+    query: types.CallbackQuery, session: Session
+) -> None:
     document_id = query.data.split("_")[1]
-    token = get_user(query.from_user.id).get("token")
-    verification_response = api.request_verification_code(token, document_id)
+    verification_response = await api.request_verification_code(
+        session.token, document_id
+    )
 
     if verification_response.status_code != 200:
         await query.message.edit_text(
@@ -487,27 +699,35 @@ async def verification_code_handler(query: types.CallbackQuery) -> None:
         return
 
     verification_data = verification_response.json()
+    verification_token = verification_data.get("token")
 
-    qr = qrcode.make(verification_data.get("token"))
+    # Resends of a token that was already uploaded skip the upload entirely
+    photo = qr.cached_file_id(verification_token) or types.BufferedInputFile(
+        await qr.render(verification_token),
+        filename="qr_code.png",
+    )
 
     # remove mackup from the message
     await query.message.delete_reply_markup()
 
-    await query.message.answer_photo(
-        photo=types.BufferedInputFile(
-            image_to_byte_array(qr),
-            filename="qr_code.png",
-        ),
+    _m = await query.message.answer_photo(
+        photo=photo,
         caption="Verification QR code.\nPlease, scan it with your device.\n\nThis QR code is valid for 3 minutes.",
     )
 
+    qr.remember_file_id(verification_token, _m.photo[-1].file_id)
+
+    await schedule_deletion(_m.chat.id, _m.message_id, settings.QR_CODE_TTL)
+
 
 @dp.callback_query(F.data.startswith("document_"))
-async def callback_query_handler(query: types.CallbackQuery) -> None:
+@authorization_required
+async def callback_query_handler(query: types.CallbackQuery, session: Session) -> None:
     # functionality basing on the query data
     document_id = query.data.split("_")[1]
-    token = get_user(query.from_user.id).get("token")
-    selected_document = api.get_document(token, document_id)
+    selected_document = await responses.get_document(
+        query.from_user.id, session.token, document_id
+    )
 
     if selected_document.status_code != 200:
         await query.message.edit_text(
@@ -518,24 +738,11 @@ async def callback_query_handler(query: types.CallbackQuery) -> None:
         return
 
     selected_document = selected_document.json()
-    await query.answer("Document is sent to you.")
-
-    document_data = selected_document.get("data")
-
-    parts = [
-        f"{hbold(selected_document.get('metadata').get('document_name'))}\n",
-    ]
 
-    for key, value in document_data.items():
-        if isinstance(value, dict):
-            # parts.append(f"{key.replace('_', ' ').capitalize()} Information")
-            for k, v in value.items():
-                parts.append(
-                    f"{key.replace('_', ' ').capitalize()} {k.replace('_', ' ').capitalize()}\n{hbold(v)}\n"
-                )
-            # parts.append("")
-        else:
-            parts.append(f"{key.replace('_', ' ').capitalize()}\n{hbold(value)}\n")
+    messages = documents.render(
+        selected_document.get("data"),
+        title=selected_document.get("metadata").get("document_name"),
+    )
 
     # Provide verification code button
     builder = InlineKeyboardBuilder()
@@ -546,14 +753,105 @@ async def callback_query_handler(query: types.CallbackQuery) -> None:
         )
     )
 
-    await query.message.edit_text("\n".join(parts), reply_markup=builder.as_markup())
+    # The button goes under the last part of a document that didn't fit
+    await query.message.edit_text(
+        messages[0],
+        reply_markup=builder.as_markup() if len(messages) == 1 else None,
+    )
+
+    for i, text in enumerate(messages[1:], start=2):
+        await query.message.answer(
+            text, reply_markup=builder.as_markup() if i == len(messages) else None
+        )
 
 
-async def main() -> None:
-    bot = Bot(TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
+def create_bot() -> Bot:
+    session = None
+
+    if settings.BOT_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(settings.BOT_API_URL))
+
+    return Bot(
+        TOKEN,
+        session=session,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+    )
+
+
+@dp.errors(ExceptionTypeFilter(api.Unauthorized))
+async def unauthorized_handler(event: types.ErrorEvent) -> None:
+    update = event.update.event
 
-    # set commands
+    await token_manager.invalidate(update.from_user.id, event.exception.token)
+
+    await reply(update, SESSION_EXPIRED)
+
+
+@dp.errors(ExceptionTypeFilter(api.Unavailable))
+async def unavailable_handler(event: types.ErrorEvent) -> None:
+    # Answered right away: the call was never made, so nothing is waited for
+    await reply(
+        event.update.event,
+        "ApexID is not responding at the moment. Please, try again in a minute.",
+    )
+
+
+@dp.errors(ExceptionTypeFilter(aiohttp.ClientError, asyncio.TimeoutError))
+async def upstream_error_handler(event: types.ErrorEvent) -> None:
+    # api retried already; Telegram's own errors arrive wrapped by aiogram
+    logging.error("ApexID call failed", exc_info=event.exception)
+
+    await reply(
+        event.update.event,
+        "ApexID could not be reached. Please, try again in a minute.",
+    )
+
+
+def setup(bot: Bot) -> None:
+    # Every chat-bound call from here on goes through the outbox
+    bot.session.middleware(outbox)
+
+    metrics.register_collector("bot_apexid", api.stats)
+    metrics.register_collector("bot_serialization", serialization_middleware.stats)
+    metrics.register_collector("bot_session_cache", session_middleware.stats)
+    metrics.register_collector("bot_response_cache", responses.response_cache.stats)
+    metrics.register_collector("bot_outbox", outbox.stats)
+    metrics.register_collector("bot_deletions", deletion_scheduler.stats)
+    metrics.register_collector("bot_notifier", notification_poller.stats)
+    metrics.register_collector("bot_tokens", token_manager.stats)
+    metrics.register_collector(
+        "bot_verification_cache", verification.verification_cache.stats
+    )
+    metrics.register_collector("bot_scan_limiter", verification.scan_limiter.stats)
 
+    dp.include_router(form_router)
+    dp.startup.register(metrics.start)
+    dp.startup.register(outbox.start)
+    dp.startup.register(deletion_scheduler.start)
+    dp.shutdown.register(deletion_scheduler.stop)
+    dp.startup.register(token_manager.start)
+    dp.shutdown.register(token_manager.stop)
+
+    if settings.NOTIFIER_ENABLED:
+        dp.startup.register(notification_poller.start)
+        dp.shutdown.register(notification_poller.stop)
+
+    dp.shutdown.register(outbox.stop)
+    dp.shutdown.register(api.close)
+    dp.shutdown.register(redis.close)
+    dp.shutdown.register(qr.shutdown)
+    dp.shutdown.register(metrics.stop)
+
+    if settings.QR_PREWARM:
+        dp.startup.register(qr.prewarm)
+
+    if settings.STARTUP_PROFILE:
+        # Registered last so that "startup" covers every other hook
+        dp.startup.register(startup_profiler.ready)
+        dp.update.outer_middleware(startup_profiler)
+
+
+async def set_commands(bot: Bot) -> None:
     await bot.set_my_commands(
         [
             types.BotCommand(command="start", description="Start the bot"),
@@ -565,26 +863,43 @@ async def main() -> None:
             types.BotCommand(
                 command="notifications", description="Get your notifications"
             ),
+            types.BotCommand(
+                command="subscribe", description="Toggle notifications push"
+            ),
             types.BotCommand(command="cabinet", description="Get your applications"),
             types.BotCommand(command="documents", description="Get your documents"),
         ]
     )
 
-    dp.include_router(form_router)
+
+async def main() -> None:
+    bot = create_bot()
+
+    await set_commands(bot)
+    setup(bot)
+
+    if settings.BOT_MODE == "webhook":
+        await run_webhook(dp, bot, serialization_middleware)
+        return
+
+    # Polling is refused by Telegram while a webhook is set
+    await bot.delete_webhook()
     await dp.start_polling(bot)
 
 
-if __name__ == "__main__":
+async def work(updates: multiprocessing.queues.Queue) -> None:
+    # One of the worker processes of bot.supervisor
+    bot = create_bot()
 
-    current_date = datetime.datetime.now().strftime("%Y-%m-%d")
-    log_file = f"logs/log_{current_date}.txt"
+    setup(bot)
+    await run_worker(dp, bot, updates, serialization_middleware)
 
-    logging.basicConfig(
-        # filename=log_file,
-        # filemode="a",
-        format="%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s",
-        datefmt="%H:%M:%S",
-        level=logging.DEBUG,
-    )
 
-    asyncio.run(main())
+if __name__ == "__main__":
+
+    log.setup()
+
+    try:
+        asyncio.run(main())
+    finally:
+        log.shutdown()
@@ -1,17 +1,220 @@
-import requests
-from bot.core import config
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any
 
+import aiohttp
 
-def login(email: str, password: str) -> requests.Response:
-    endpoint = f"{config.settings.API_URL}/api/v1/public/authorization/signin"
+from bot.core import config, log, metrics
+from bot.core.resilience import AdaptiveLimiter, CircuitBreaker, backoff
+
+
+@dataclass
+class Response:
+    status_code: int
+    content: bytes
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+
+class Unauthorized(Exception):
+    """ApexID rejected the token a call was made with."""
+
+    def __init__(self, token: str) -> None:
+        super().__init__("ApexID rejected the token")
+        self.token = token
+
+
+class Unavailable(Exception):
+    """
+    The call wasn't made: the breaker of its function is open, or no slot
+    under the concurrency limit freed up in time.
+    """
+
+    def __init__(self, name: str) -> None:
+        super().__init__(f"ApexID is unavailable ({name})")
+        self.name = name
+
+
+API_LATENCY = metrics.Histogram(
+    "apexid_api_seconds",
+    "ApexID API call duration, by function",
+    labels=("function",),
+)
+API_RESPONSES = metrics.Counter(
+    "apexid_api_responses_total",
+    "ApexID API calls by function and HTTP status ('error' when none)",
+    labels=("function", "status"),
+)
+
+_session: aiohttp.ClientSession | None = None
+
+_breakers: dict[str, CircuitBreaker] = {}
+limiter = AdaptiveLimiter(
+    initial=config.settings.API_LIMIT_INITIAL,
+    minimum=config.settings.API_LIMIT_MIN,
+    maximum=config.settings.API_LIMIT_MAX,
+    target=config.settings.API_LATENCY_TARGET,
+)
+_counts = {"retries": 0, "short_circuited": 0}
+
+
+def get_session() -> aiohttp.ClientSession:
+    # The session is created lazily so that it's bound to the running loop
+    global _session
+
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=config.settings.API_POOL_SIZE,
+            limit_per_host=config.settings.API_POOL_SIZE_PER_HOST,
+            keepalive_timeout=config.settings.API_KEEPALIVE_TIMEOUT,
+        )
+        _session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(
+                total=config.settings.API_TIMEOUT,
+                connect=config.settings.API_CONNECT_TIMEOUT,
+            ),
+        )
+
+    return _session
+
+
+async def close() -> None:
+    global _session
+
+    if _session is not None and not _session.closed:
+        await _session.close()
+
+    _session = None
+
+
+def _breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(
+            threshold=config.settings.API_BREAKER_THRESHOLD,
+            reset_timeout=config.settings.API_BREAKER_RESET,
+        )
+
+    return breaker
+
+
+def stats() -> dict[str, float]:
+    return {
+        "limit": limiter.limit,
+        "in_flight": limiter.in_flight,
+        "rejected": limiter.rejected,
+        "open_breakers": sum(b.is_open for b in _breakers.values()),
+        **_counts,
+    }
+
+
+async def _send(
+    name: str, method: str, endpoint: str, payload: dict | None, kwargs: dict
+) -> tuple[int, bytes]:
+    status = "error"
+    started = time.perf_counter()
+
+    try:
+        with log.bind(upstream=name), API_LATENCY.time(name):
+            async with get_session().request(
+                method, f"{config.settings.API_URL}{endpoint}", json=payload, **kwargs
+            ) as response:
+                status = response.status
+                content = await response.read()
+    finally:
+        API_RESPONSES.inc(name, status)
+
+        with log.bind(upstream=name):
+            logging.debug(
+                "%s %s -> %s in %.3fs",
+                method,
+                endpoint,
+                status,
+                time.perf_counter() - started,
+            )
+
+    return status, content
+
+
+async def _request(
+    name: str,
+    method: str,
+    endpoint: str,
+    token: str | None = None,
+    payload: dict | None = None,
+    timeout: float | None = None,
+) -> Response:
+    kwargs = {}
+
+    if token is not None:
+        kwargs["headers"] = {"Authorization": f"{token}"}
+
+    if timeout is not None:
+        # Per-call override, otherwise the session-wide timeout applies
+        kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+    breaker = _breaker(name)
+    # Only GETs are safe to repeat, a retried signup might register twice
+    attempts = 1 + config.settings.API_RETRIES if method == "GET" else 1
+
+    for attempt in range(attempts):
+        if attempt:
+            _counts["retries"] += 1
+            await asyncio.sleep(backoff(attempt - 1, config.settings.API_RETRY_BACKOFF))
+
+        if not breaker.allow():
+            _counts["short_circuited"] += 1
+            raise Unavailable(name)
+
+        if not await limiter.acquire(config.settings.API_LIMIT_QUEUE_TIMEOUT):
+            raise Unavailable(name)
+
+        started = time.perf_counter()
+        ok = False
+
+        try:
+            status, content = await _send(name, method, endpoint, payload, kwargs)
+            ok = status < 500
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            breaker.failure()
+
+            if attempt + 1 == attempts:
+                raise
+
+            continue
+        finally:
+            limiter.release(time.perf_counter() - started, ok)
+
+        if ok:
+            breaker.success()
+            break
+
+        breaker.failure()
+
+    # Handled once, by the dispatcher's error handler, instead of every
+    # caller turning it into "Something went wrong"
+    if status == 401 and token is not None:
+        raise Unauthorized(token)
+
+    return Response(status_code=status, content=content)
+
+
+async def login(email: str, password: str, timeout: float | None = None) -> Response:
+    endpoint = "/api/v1/public/authorization/signin"
 
     data = {"email": email, "password": password}
 
-    return requests.post(endpoint, json=data)
+    return await _request("login", "POST", endpoint, payload=data, timeout=timeout)
 
 
-def register(data: dict) -> requests.Response:
-    endpoint = f"{config.settings.API_URL}/api/v1/public/authorization/signup"
+async def register(data: dict, timeout: float | None = None) -> Response:
+    endpoint = "/api/v1/public/authorization/signup"
 
     _payload = {
         "email": data.get("email"),
@@ -27,60 +230,54 @@ def register(data: dict) -> requests.Response:
         },
     }
 
-    return requests.post(endpoint, json=_payload)
-
-
-def get_profile(token: str) -> requests.Response:
-    endpoint = f"{config.settings.API_URL}/api/v1/private/profile/my"
-
-    headers = {"Authorization": f"{token}"}
-
-    return requests.get(endpoint, headers=headers)
+    return await _request(
+        "register", "POST", endpoint, payload=_payload, timeout=timeout
+    )
 
 
-def get_notifications(token: str) -> requests.Response:
-    endpoint = f"{config.settings.API_URL}/api/v1/private/profile/my/notifications"
+async def get_profile(token: str, timeout: float | None = None) -> Response:
+    endpoint = "/api/v1/private/profile/my"
 
-    headers = {"Authorization": f"{token}"}
+    return await _request("get_profile", "GET", endpoint, token=token, timeout=timeout)
 
-    return requests.get(endpoint, headers=headers)
 
+async def get_notifications(token: str, timeout: float | None = None) -> Response:
+    endpoint = "/api/v1/private/profile/my/notifications"
 
-def cabinet(token: str) -> requests.Response:
-    endpoint = f"{config.settings.API_URL}/api/v1/private/application/cabinet"
+    return await _request(
+        "get_notifications", "GET", endpoint, token=token, timeout=timeout
+    )
 
-    headers = {"Authorization": f"{token}"}
 
-    return requests.get(endpoint, headers=headers)
+async def cabinet(token: str, timeout: float | None = None) -> Response:
+    endpoint = "/api/v1/private/application/cabinet"
 
+    return await _request("cabinet", "GET", endpoint, token=token, timeout=timeout)
 
-def get_documets(token: str) -> requests.Response:
-    endpoint = f"{config.settings.API_URL}/api/v1/private/profile/my/documents"
 
-    headers = {"Authorization": f"{token}"}
+async def get_documets(token: str, timeout: float | None = None) -> Response:
+    endpoint = "/api/v1/private/profile/my/documents"
 
-    return requests.get(endpoint, headers=headers)
+    return await _request("get_documets", "GET", endpoint, token=token, timeout=timeout)
 
 
-def get_document(token: str, id: int) -> requests.Response:
-    endpoint = f"{config.settings.API_URL}/api/v1/private/profile/my/documents/{id}"
+async def get_document(token: str, id: int, timeout: float | None = None) -> Response:
+    endpoint = f"/api/v1/private/profile/my/documents/{id}"
 
-    headers = {"Authorization": f"{token}"}
+    return await _request("get_document", "GET", endpoint, token=token, timeout=timeout)
 
-    return requests.get(endpoint, headers=headers)
 
+async def request_verification_code(
+    token: str, id: str, timeout: float | None = None
+) -> Response:
+    endpoint = f"/api/v1/private/profile/my/documents/{id}/confirm"
 
-def request_verification_code(token: str, id: str) -> requests.Response:
-    endpoint = (
-        f"{config.settings.API_URL}/api/v1/private/profile/my/documents/{id}/confirm"
+    return await _request(
+        "request_verification_code", "GET", endpoint, token=token, timeout=timeout
     )
 
-    headers = {"Authorization": f"{token}"}
-
-    return requests.get(endpoint, headers=headers)
-
 
-def verify_code(code: str):
-    endpoint = f"{config.settings.API_URL}/api/v1/public/document/verify/{code}"
+async def verify_code(code: str, timeout: float | None = None) -> Response:
+    endpoint = f"/api/v1/public/document/verify/{code}"
 
-    return requests.get(endpoint)
+    return await _request("verify_code", "GET", endpoint, timeout=timeout)
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class TTLCache:
+    """Bounded LRU mapping whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key)
+
+        if item is None:
+            return default
+
+        expires_at, value = item
+
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float | None = None) -> None:
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.pop(key, None)
+        return default if item is None else item[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+
+@dataclass(slots=True)
+class _Entry:
+    value: Any
+    fresh_until: float
+
+
+class ResponseCache:
+    """
+    Per-user cache of upstream responses with stale-while-revalidate.
+
+    A fresh entry is returned as is. A stale one is returned immediately while
+    a single background refresh runs; concurrent misses for the same key share
+    one upstream call. Only successful responses are stored.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._entries = TTLCache(maxsize=maxsize, ttl=0)
+        self._inflight: dict[Hashable, asyncio.Task] = {}
+        # Bumped on invalidation, so older entries (and fetches still in
+        # flight for them) can no longer be reached
+        self._generations: dict[int, int] = {}
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+
+    async def get(
+        self,
+        user_id: int,
+        endpoint: str,
+        fetch: Callable[..., Awaitable[Any]],
+        *args: Any,
+        ttl: float,
+        stale_ttl: float,
+    ) -> Any:
+        key = (user_id, self._generations.get(user_id, 0), endpoint, args)
+        entry: _Entry | None = self._entries.get(key)
+
+        if entry is not None:
+            if entry.fresh_until > time.monotonic():
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self._fetch(key, fetch, args, ttl, stale_ttl)
+
+            return entry.value
+
+        self.misses += 1
+
+        # Shielded so a cancelled caller doesn't cancel everyone's fetch
+        return await asyncio.shield(self._fetch(key, fetch, args, ttl, stale_ttl))
+
+    def put(
+        self,
+        user_id: int,
+        endpoint: str,
+        *args: Any,
+        value: Any,
+        ttl: float,
+        stale_ttl: float,
+    ) -> None:
+        """Stores a response fetched elsewhere, as if ``get`` had fetched it."""
+
+        key = (user_id, self._generations.get(user_id, 0), endpoint, args)
+        self._set(key, value, ttl, stale_ttl)
+
+    def invalidate(self, user_id: int) -> None:
+        self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.stale_hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "upstream_calls": self.upstream_calls,
+            "size": len(self._entries),
+        }
+
+    def _fetch(
+        self,
+        key: Hashable,
+        fetch: Callable[..., Awaitable[Any]],
+        args: tuple,
+        ttl: float,
+        stale_ttl: float,
+    ) -> asyncio.Task:
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = asyncio.create_task(self._store(key, fetch, args, ttl, stale_ttl))
+            task.add_done_callback(partial(self._done, key))
+            self._inflight[key] = task
+
+        return task
+
+    async def _store(
+        self,
+        key: Hashable,
+        fetch: Callable[..., Awaitable[Any]],
+        args: tuple,
+        ttl: float,
+        stale_ttl: float,
+    ) -> Any:
+        self.upstream_calls += 1
+        response = await fetch(*args)
+        self._set(key, response, ttl, stale_ttl)
+
+        return response
+
+    def _set(self, key: Hashable, response: Any, ttl: float, stale_ttl: float) -> None:
+        if response.status_code == 200:
+            self._entries.set(
+                key,
+                _Entry(value=response, fresh_until=time.monotonic() + ttl),
+                ttl=ttl + stale_ttl,
+            )
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        self._inflight.pop(key, None)
+
+        # Background refreshes have no awaiter to report to
+        if not task.cancelled() and task.exception() is not None:
+            logging.warning("Refreshing %s failed: %r", key[2], task.exception())
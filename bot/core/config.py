@@ -1,3 +1,6 @@
+from functools import cache
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 
 
@@ -5,9 +8,176 @@ class Settings(BaseSettings):
     BOT_TOKEN: str
     API_URL: str
 
+    # Telegram: "polling", or "webhook" served by our own aiohttp server
+    BOT_MODE: Literal["polling", "webhook"] = "polling"
+    # Custom Bot API server, e.g. a self-hosted telegram-bot-api
+    BOT_API_URL: str | None = None
+
+    WEBHOOK_URL: str | None = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: str | None = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    WEBHOOK_MAX_CONNECTIONS: int = 40
+    WEBHOOK_MAX_CONCURRENCY: int = 200
+    # Updates of one user waiting behind the one of theirs being processed
+    WEBHOOK_MAX_PENDING: int = 50
+    WEBHOOK_DRAIN_TIMEOUT: float = 30.0
+
+    # python -m bot.supervisor: the webhook served by one process, updates
+    # handled by WORKERS processes (one per CPU by default), each user's by
+    # the same one
+    WORKERS: int | None = None
+    WORKER_QUEUE_SIZE: int = 1000
+    # How long an update waits for room in a full queue before the webhook
+    # answers 503 and Telegram delivers it again later
+    WORKER_QUEUE_TIMEOUT: float = 10.0
+    WORKER_RESTART_BACKOFF: float = 1.0
+
+    # ApexID API client
+    API_TIMEOUT: float = 10.0
+    API_CONNECT_TIMEOUT: float = 3.0
+    API_POOL_SIZE: int = 100
+    API_POOL_SIZE_PER_HOST: int = 50
+    API_KEEPALIVE_TIMEOUT: float = 30.0
+    # Resilience, see bot.core.resilience: retries of GETs with jittered
+    # backoff, a circuit breaker per function and an AIMD concurrency limit
+    # that grows while calls take under API_LATENCY_TARGET seconds
+    API_RETRIES: int = 2
+    API_RETRY_BACKOFF: float = 0.2
+    API_BREAKER_THRESHOLD: int = 5
+    API_BREAKER_RESET: float = 30.0
+    API_LATENCY_TARGET: float = 1.0
+    API_LIMIT_INITIAL: int = 20
+    API_LIMIT_MIN: int = 5
+    API_LIMIT_MAX: int = 50  # no use above API_POOL_SIZE_PER_HOST
+    API_LIMIT_QUEUE_TIMEOUT: float = 2.0
+
+    # Redis
+    REDIS_URL: str = "redis://localhost:6379/0"
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: float = 5.0
+    REDIS_SOCKET_TIMEOUT: float = 5.0
+
+    # In-process session cache
+    SESSION_CACHE_SIZE: int = 10_000
+    SESSION_CACHE_TTL: float = 5.0
+
+    # Lifetime of stored sessions, see bot.core.redis
+    # Idle time after which a session whose token expiry is unknown is
+    # dropped, counted from its user's last update
+    SESSION_TTL: float = 30 * 86400.0
+    SESSION_EXPIRED_GRACE: float = 86400.0
+
+    # ApexID token lifecycle, see bot.core.tokens
+    TOKEN_EXPIRY_SKEW: float = 30.0
+    TOKEN_REFRESH_MARGIN: float = 600.0
+    TOKEN_VALIDATION_INTERVAL: float = 900.0
+    TOKEN_VALIDATION_BATCH: int = 500
+    # Also ask ApexID (get_profile) about every stored session each sweep,
+    # the only check there is for tokens without a JWT exp besides a user's
+    # own calls. Sweeps then share the API limiter and breakers with users
+    TOKEN_VALIDATION_UPSTREAM: bool = False
+    TOKEN_VALIDATION_CONCURRENCY: int = 10
+
+    # FSM storage for the login/register flows
+    FSM_STORAGE: Literal["redis", "memory"] = "redis"
+    FSM_STATE_TTL: int = 3600
+    FSM_DATA_TTL: int = 3600
+
+    # Per-user cache of API responses, served stale for up to
+    # RESPONSE_CACHE_STALE_TTL more seconds while it's being refreshed
+    RESPONSE_CACHE_SIZE: int = 50_000
+    RESPONSE_CACHE_STALE_TTL: float = 300.0
+    RESPONSE_CACHE_TTL_NOTIFICATIONS: float = 15.0
+    RESPONSE_CACHE_TTL_CABINET: float = 30.0
+    RESPONSE_CACHE_TTL_DOCUMENTS: float = 60.0
+    RESPONSE_CACHE_TTL_DOCUMENT: float = 300.0
+    # How long login waits for the responses it prefetches into the cache
+    LOGIN_PREFETCH_TIMEOUT: float = 2.0
+
+    # Repeats of a callback query within this many seconds are dropped
+    CALLBACK_DEDUP_WINDOW: float = 2.0
+
+    NOTIFICATIONS_PAGE_SIZE: int = 5
+
+    # Background push of new notifications to /subscribe'd users
+    NOTIFIER_ENABLED: bool = True
+    NOTIFIER_INTERVAL: float = 60.0
+    NOTIFIER_CONCURRENCY: int = 20
+
+    # Outbound Bot API calls, see bot.core.outbox
+    OUTBOX_GLOBAL_RATE: float = 25.0
+    OUTBOX_CHAT_RATE: float = 1.0
+    OUTBOX_CHAT_BURST: int = 5
+    OUTBOX_BACKGROUND_LIMIT: int = 10_000
+    OUTBOX_MAX_RETRIES: int = 3
+    OUTBOX_RETRY_BACKOFF: float = 0.5
+    OUTBOX_DRAIN_TIMEOUT: float = 10.0
+
+    # Prometheus endpoint at http://METRICS_HOST:METRICS_PORT/metrics
+    METRICS_ENABLED: bool = True
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9100
+    METRICS_LOOP_LAG_INTERVAL: float = 0.5
+
+    # JSON lines in LOG_DIR/bot.log, rotated daily. DEBUG records are kept
+    # for a LOG_DEBUG_SAMPLE_RATE share of updates only
+    LOG_LEVEL: str = "INFO"
+    LOG_DEBUG_SAMPLE_RATE: float = 0.0
+    LOG_DIR: str = "logs"
+    LOG_BACKUP_COUNT: int = 14
+    LOG_CONSOLE: bool = True
+    # Log how long imports, startup and the first update took
+    STARTUP_PROFILE: bool = False
+
+    # QR decoding pool
+    QR_EXECUTOR: Literal["process", "thread"] = "process"
+    QR_WORKERS: int = 2
+    QR_QUEUE_SIZE: int = 32
+    QR_QUEUE_TIMEOUT: float = 5.0
+    QR_DOWNSCALE_SIZE: int = 800
+    QR_PHOTO_MIN_SIDE: int = 640
+    # Import the imaging libraries in every worker at startup instead of
+    # on the first photo
+    QR_PREWARM: bool = False
+    # Albums are verified together: photos arriving within this many
+    # seconds of each other, VERIFY_CONCURRENCY codes at a time
+    MEDIA_GROUP_WINDOW: float = 1.0
+    VERIFY_CONCURRENCY: int = 8
+    # verify_code results by code. A cached success may be answered up to
+    # VERIFY_CACHE_TTL after its code expired, keep it short
+    VERIFY_CACHE_SIZE: int = 10_000
+    VERIFY_CACHE_TTL: float = 10.0
+    VERIFY_NEGATIVE_TTL: float = 180.0
+    # Photos a user may have decoded: per second, and at once (an album
+    # holds up to 10)
+    SCAN_RATE: float = 0.5
+    SCAN_BURST: int = 10
+
+    # QR rendering
+    QR_CODE_TTL: float = 180.0
+    QR_BOX_SIZE: int = 8
+    QR_BORDER: int = 4
+    QR_RENDER_CACHE_SIZE: int = 1_000
+
+    # Scheduled message deletion
+    DELETION_INTERVAL: float = 1.0
+    DELETION_BATCH_SIZE: int = 500
+
     class Config:
         case_sensitive = True
         env_file = ".env"
 
 
-settings = Settings()
+@cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+def __getattr__(name: str):
+    # ``settings`` is read from the environment on first use, not on import
+    if name == "settings":
+        return get_settings()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
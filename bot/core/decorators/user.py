@@ -1,15 +1,54 @@
+import inspect
 from functools import wraps
-from bot.core.redis import is_user_exist
+
+from aiogram.types import CallbackQuery, Message
+
+from bot.core.tokens import TokenState, token_manager
+
+SESSION_EXPIRED = "Your session has expired. Please, /login again."
+
+
+async def reply(event: Message | CallbackQuery, text: str) -> None:
+    # Callback queries are answered on arrival (SerializationMiddleware),
+    # what a handler has to say goes to their chat instead
+    if isinstance(event, CallbackQuery):
+        await event.message.answer(text)
+    else:
+        await event.answer(text)
 
 
 def authorization_required(func):
+    # aiogram unwraps handlers and passes only the arguments the wrapped
+    # function declares: without ``session`` this would never see one
+    if "session" not in inspect.signature(func).parameters:
+        raise TypeError(f"{func.__qualname__} must accept a session argument")
+
     @wraps(func)
-    async def wrapper(*args, **kwargs):
-        if is_user_exist(args[0].from_user.id):
-            return await func(*args, **kwargs)
+    async def wrapper(event, **kwargs):
+        session = kwargs.get("session")
+
+        if session is not None:
+            state = token_manager.state(session)
+
+            if state is TokenState.EXPIRED:
+                # Don't waste a round-trip on a token ApexID will refuse
+                await token_manager.invalidate(event.from_user.id, session.token)
+                await reply(event, SESSION_EXPIRED)
+                return
+
+            result = await func(event, **kwargs)
+
+            if (
+                state is TokenState.EXPIRING
+                and isinstance(event, Message)
+                and await token_manager.warn_once(event.from_user.id, session)
+            ):
+                await event.answer(
+                    "Your session expires soon. Please, /login again to renew it."
+                )
+
+            return result
 
-        await args[0].answer(
-            "You are not authorized yet. Please, /login or /register.",
-        )
+        await reply(event, "You are not authorized yet. Please, /login or /register.")
 
     return wrapper
@@ -0,0 +1,89 @@
+import html
+from functools import lru_cache
+from typing import Any, Iterator
+
+from bot.core.text import TELEGRAM_MESSAGE_LIMIT, split_message
+
+# Room for "<b></b>" and the trailing newline around a value
+_MARKUP = len("<b></b>\n")
+
+
+@lru_cache(maxsize=4096)
+def label(key: str) -> str:
+    # Documents of one kind share their keys, so each is transformed once
+    return html.escape(key.replace("_", " ").capitalize(), quote=False)
+
+
+def _pieces(text: str, size: int) -> Iterator[str]:
+    # ``text`` is escaped already, cut it anywhere but inside an entity
+    while len(text) > size:
+        cut = size
+        # Entities escape() produces are at most 5 characters long
+        amp = text.rfind("&", cut - 4, cut)
+
+        if amp != -1 and ";" not in text[amp:cut]:
+            cut = amp
+
+        yield text[:cut]
+        text = text[cut:]
+
+    if text:
+        yield text
+
+
+def fields(
+    data: Any, name: str = "", limit: int = TELEGRAM_MESSAGE_LIMIT
+) -> Iterator[str]:
+    """
+    Yields a "Label\\n<b>value</b>\\n" part per scalar in ``data``, however
+    deeply nested. Labels of nested fields are prefixed with their parents',
+    items of lists of dicts with their position.
+    """
+
+    if isinstance(data, dict):
+        for key, value in data.items():
+            yield from fields(
+                value, f"{name} {label(key)}" if name else label(key), limit
+            )
+        return
+
+    if isinstance(data, list) and any(isinstance(v, (dict, list)) for v in data):
+        for i, value in enumerate(data, start=1):
+            yield from fields(value, f"{name} {i}", limit)
+        return
+
+    value = ", ".join(map(str, data)) if isinstance(data, list) else str(data)
+    text = html.escape(value, quote=False)
+
+    if len(name) + len(text) + _MARKUP < limit:
+        yield f"{name}\n<b>{text}</b>\n"
+        return
+
+    # Too long for one message: the value is spread over several
+    yield name
+    yield from (f"<b>{piece}</b>" for piece in _pieces(text, limit - _MARKUP))
+
+
+def render(
+    data: dict,
+    title: str | None = None,
+    footer: str | None = None,
+    limit: int = TELEGRAM_MESSAGE_LIMIT,
+) -> list[str]:
+    """
+    Formats a document for ``ParseMode.HTML``: everything coming from the
+    document is escaped, ``footer`` is used as is. Returns as many messages
+    as it takes to stay within ``limit``.
+    """
+
+    parts = []
+
+    if title is not None:
+        parts.append(f"<b>{html.escape(title, quote=False)}</b>\n")
+
+    parts.extend(fields(data, limit=limit))
+
+    if footer is not None:
+        parts.append(footer)
+
+    return split_message(parts, limit)
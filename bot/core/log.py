@@ -0,0 +1,129 @@
+"""
+Structured logging.
+
+Records are handed to a queue by the calling code and written as JSON lines
+by a background thread, so handlers never wait on disk or console I/O. Each
+line carries the correlation fields bound for the current update (update id,
+user id, handler, upstream call).
+"""
+
+import json
+import logging
+import logging.handlers
+import queue
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from bot.core import config
+
+_context: ContextVar[dict] = ContextVar("log_context", default={})
+_sampled: ContextVar[bool] = ContextVar("log_sampled", default=False)
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+@contextmanager
+def bind(**fields):
+    """Adds ``fields`` to every record logged inside the block."""
+
+    token = _context.set({**_context.get(), **fields})
+
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+@contextmanager
+def sample():
+    """Keeps DEBUG records inside the block for a LOG_DEBUG_SAMPLE_RATE share of calls."""
+
+    token = _sampled.set(random.random() < config.settings.LOG_DEBUG_SAMPLE_RATE)
+
+    try:
+        yield
+    finally:
+        _sampled.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Runs in the logging thread of the caller: attaches the bound context and
+    drops DEBUG records of updates that weren't sampled.
+    """
+
+    def __init__(self, level: int) -> None:
+        super().__init__()
+        self.level = level
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < self.level and not _sampled.get():
+            return False
+
+        record.context = _context.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S")
+            + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+
+        # QueueHandler has already folded any traceback into the message
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup() -> None:
+    global _listener
+
+    settings = config.settings
+    level = logging.getLevelName(settings.LOG_LEVEL)
+
+    Path(settings.LOG_DIR).mkdir(parents=True, exist_ok=True)
+
+    file_handler = logging.handlers.TimedRotatingFileHandler(
+        Path(settings.LOG_DIR) / "bot.log",
+        when="midnight",
+        backupCount=settings.LOG_BACKUP_COUNT,
+        encoding="utf-8",
+    )
+    handlers: list[logging.Handler] = [file_handler]
+
+    if settings.LOG_CONSOLE:
+        handlers.append(logging.StreamHandler())
+
+    formatter = JsonFormatter()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(records)
+    queue_handler.addFilter(ContextFilter(level))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    # DEBUG records are only worth creating when some of them are kept
+    root.setLevel(logging.DEBUG if settings.LOG_DEBUG_SAMPLE_RATE else level)
+
+    _listener = logging.handlers.QueueListener(
+        records, *handlers, respect_handler_level=True
+    )
+    _listener.start()
+
+
+def shutdown() -> None:
+    global _listener
+
+    if _listener is not None:
+        # Flushes whatever is still queued
+        _listener.stop()
+
+    _listener = None
@@ -0,0 +1,220 @@
+"""
+Minimal Prometheus-style metrics.
+
+Metrics are plain in-process counters updated on the hot path; the text
+exposition is only built when ``/metrics`` is scraped.
+"""
+
+import asyncio
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+
+from bot.core import config
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REGISTRY: list["_Metric"] = []
+
+# name prefix -> callable returning (or awaiting to) a dict of gauge values
+_collectors: list[tuple[str, Callable[[], dict | Awaitable[dict]]]] = []
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def _labels(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{key}="{_escape(value)}"' for key, value in zip(self.labels, values)]
+
+        if extra:
+            pairs.append(extra)
+
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def lines(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = defaultdict(float)
+
+    def inc(self, *labels: Any, amount: float = 1.0) -> None:
+        self._values[labels] += amount
+
+    def lines(self) -> list[str]:
+        return [
+            f"{self.name}{self._labels(labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: dict[tuple, float] = {}
+
+    def set(self, value: float, *labels: Any) -> None:
+        self._values[labels] = value
+
+    def lines(self) -> list[str]:
+        return [
+            f"{self.name}{self._labels(labels)} {value}"
+            for labels, value in self._values.items()
+        ]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = buckets
+        self._counts: dict[tuple, list[int]] = {}
+        self._sums: dict[tuple, float] = defaultdict(float)
+
+    def observe(self, value: float, *labels: Any) -> None:
+        counts = self._counts.get(labels)
+
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+
+        counts[bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    @contextmanager
+    def time(self, *labels: Any):
+        started = time.perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def lines(self) -> list[str]:
+        lines = []
+
+        for labels, counts in self._counts.items():
+            total = 0
+
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{self._labels(labels, le)} {total}")
+
+            lines.append(f"{self.name}_sum{self._labels(labels)} {self._sums[labels]}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {total}")
+
+        return lines
+
+
+def register_collector(prefix: str, collect: Callable[[], dict | Awaitable[dict]]):
+    """Exposes the numeric values of ``collect()`` as ``<prefix>_<key>`` gauges."""
+
+    _collectors.append((prefix, collect))
+
+
+async def render() -> str:
+    lines = []
+
+    for metric in REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.lines())
+
+    for prefix, collect in _collectors:
+        try:
+            values = collect()
+
+            if inspect.isawaitable(values):
+                values = await values
+        except Exception:
+            logging.exception("Metrics collector %s failed", prefix)
+            continue
+
+        for key, value in values.items():
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {float(value)}")
+
+    return "\n".join(lines) + "\n"
+
+
+LOOP_LAG = Histogram(
+    "bot_event_loop_lag_seconds",
+    "How late the event loop wakes up a sleeping task",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+
+_runner: web.AppRunner | None = None
+_lag_task: asyncio.Task | None = None
+
+
+async def _measure_loop_lag() -> None:
+    interval = config.settings.METRICS_LOOP_LAG_INTERVAL
+
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        LOOP_LAG.observe(max(time.perf_counter() - started - interval, 0))
+
+
+async def _handle(request: web.Request) -> web.Response:
+    return web.Response(text=await render(), content_type="text/plain", charset="utf-8")
+
+
+async def start() -> None:
+    global _runner, _lag_task
+
+    if not config.settings.METRICS_ENABLED or _runner is not None:
+        return
+
+    app = web.Application()
+    app.router.add_get("/metrics", _handle)
+
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(
+        _runner, config.settings.METRICS_HOST, config.settings.METRICS_PORT
+    ).start()
+
+    _lag_task = asyncio.create_task(_measure_loop_lag())
+
+
+async def stop() -> None:
+    global _runner, _lag_task
+
+    if _lag_task is not None:
+        _lag_task.cancel()
+        await asyncio.gather(_lag_task, return_exceptions=True)
+
+    if _runner is not None:
+        await _runner.cleanup()
+
+    _runner = _lag_task = None
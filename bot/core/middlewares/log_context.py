@@ -0,0 +1,36 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update, User
+
+from bot.core import log
+
+
+class UpdateLogContextMiddleware(BaseMiddleware):
+    """Outer update middleware: binds update and user ids, decides sampling."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+
+        with log.sample(), log.bind(
+            update_id=event.update_id, user_id=user.id if user else None
+        ):
+            return await handler(event, data)
+
+
+class HandlerLogContextMiddleware(BaseMiddleware):
+    """Inner middleware: binds the name of the handler processing the event."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with log.bind(handler=data["handler"].callback.__name__):
+            return await handler(event, data)
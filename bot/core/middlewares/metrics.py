@@ -0,0 +1,43 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.core import metrics
+
+HANDLER_LATENCY = metrics.Histogram(
+    "bot_handler_seconds",
+    "Time spent in handlers, by handler",
+    labels=("handler",),
+)
+HANDLER_ERRORS = metrics.Counter(
+    "bot_handler_errors_total",
+    "Handlers that raised, by handler",
+    labels=("handler",),
+)
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Times every handler call. Handlers are labelled by name rather than by
+    the command text, which keeps label values bounded whatever users send:
+    each command and callback prefix has its own handler.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        label = data["handler"].callback.__name__
+        started = time.perf_counter()
+
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(label)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - started, label)
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Hashable
+
+from aiogram import BaseMiddleware
+from aiogram.exceptions import TelegramAPIError
+from aiogram.types import CallbackQuery, TelegramObject, Update, User
+
+from bot.core.cache import TTLCache
+
+
+class _Slot:
+    __slots__ = ("lock", "users")
+
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+
+class KeyedLocks:
+    """One lock per key, dropped as soon as nobody holds or waits for it."""
+
+    def __init__(self) -> None:
+        self._slots: dict[Hashable, _Slot] = {}
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def locked(self, key: Hashable) -> bool:
+        slot = self._slots.get(key)
+        return slot is not None and slot.lock.locked()
+
+    @asynccontextmanager
+    async def hold(self, key: Hashable) -> AsyncIterator[None]:
+        slot = self._slots.get(key)
+
+        if slot is None:
+            slot = self._slots[key] = _Slot()
+
+        slot.users += 1
+
+        try:
+            async with slot.lock:
+                yield
+        finally:
+            slot.users -= 1
+
+            if not slot.users:
+                del self._slots[key]
+
+
+class SerializationMiddleware(BaseMiddleware):
+    """
+    Outer update middleware: runs one update per user at a time, in the
+    order they arrive, while different users run in parallel.
+
+    Callback queries are answered as soon as they arrive, so the button
+    spinner clears even while the user's previous update is still running;
+    handlers reply with a message instead. A callback with the same data on
+    the same message within ``dedup_window`` seconds is a double tap and is
+    dropped. Updates queued before they reach the dispatcher (WebhookHandler)
+    have their callback accepted on arrival instead. Photos of an album are
+    left to ``MediaGroupCollector``, which needs them to arrive together.
+    """
+
+    def __init__(self, dedup_window: float) -> None:
+        self.dedup_window = dedup_window
+        self._locks = KeyedLocks()
+        self._seen = TTLCache(maxsize=100_000, ttl=dedup_window)
+        # Callback queries accepted ahead of the dispatcher, by id
+        self._accepted: set[str] = set()
+
+        self.waited = 0
+        self.duplicates = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+
+        if user is None:
+            return await handler(event, data)
+
+        if event.callback_query is not None:
+            query = event.callback_query
+
+            if query.id in self._accepted:
+                self._accepted.discard(query.id)
+            elif not await self._accept(query):
+                return None
+
+        if event.message is not None and event.message.media_group_id is not None:
+            return await handler(event, data)
+
+        if self._locks.locked(user.id):
+            self.waited += 1
+
+        async with self._locks.hold(user.id):
+            return await handler(event, data)
+
+    async def accept(self, query: CallbackQuery) -> bool:
+        """
+        Answers a callback query before its update is dispatched, ``False``
+        for a double tap, which is not to be dispatched at all.
+        """
+
+        if not await self._accept(query):
+            return False
+
+        self._accepted.add(query.id)
+
+        return True
+
+    async def _accept(self, query: CallbackQuery) -> bool:
+        try:
+            await query.answer()
+        except TelegramAPIError as e:
+            # Too old to answer, still worth handling
+            logging.debug("Could not answer callback query: %s", e)
+
+        key = (
+            query.from_user.id,
+            query.message and query.message.message_id,
+            query.data,
+        )
+
+        if self._seen.get(key):
+            self.duplicates += 1
+            return False
+
+        self._seen.set(key, True)
+
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "users": len(self._locks),
+            "waited": self.waited,
+            "duplicates": self.duplicates,
+        }
@@ -0,0 +1,51 @@
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, User
+
+from bot.core.redis import get_user
+from bot.core.session import Session, session_cache
+
+_MISSING = object()
+
+
+class SessionMiddleware(BaseMiddleware):
+    """
+    Loads the user's session once per update and passes it to handlers as
+    ``session`` (``None`` when the user is not authorized).
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user: User | None = data.get("event_from_user")
+
+        if user is not None:
+            data["session"] = await self.load(user.id)
+
+        return await handler(event, data)
+
+    async def load(self, user_id: int) -> Session | None:
+        session = session_cache.get(user_id, _MISSING)
+
+        if session is not _MISSING:
+            self.hits += 1
+            return session
+
+        self.misses += 1
+
+        raw = await get_user(user_id, renew=True)
+        session = Session.from_dict(raw) if raw else None
+        session_cache.set(user_id, session)
+
+        return session
+
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(session_cache)}
@@ -0,0 +1,88 @@
+import datetime
+import heapq
+import html
+
+from aiogram.utils.markdown import hbold
+
+from bot.core.redis import r
+
+# Newest notification shown to the user / pushed to them, per user
+SEEN_KEY = "apexid:notifications:seen"
+PUSHED_KEY = "apexid:notifications:pushed"
+
+"""
+{
+    "_id": "65ce9227ac91b58fd40c91bd",
+    "user_id": "65ce28267e6a49005d3f5c5d",
+    "message": "New device signed in to your account, DeviceID: 65ce9227ac91b58fd40c91bc",
+    "created_at": "2024-02-15T22:37:27.535000",
+    "created_by": "system",
+    "metadata": {}
+},
+"""
+
+
+def sort_key(notification: dict) -> tuple[str, str]:
+    # ISO timestamps in one format sort correctly as strings, no parsing needed
+    return (notification.get("created_at") or "", notification.get("_id") or "")
+
+
+def latest(
+    notifications: list[dict], limit: int, older_than: tuple[str, str] | None = None
+) -> list[dict]:
+    if older_than is not None:
+        notifications = (n for n in notifications if sort_key(n) < older_than)
+
+    return heapq.nlargest(limit, notifications, key=sort_key)
+
+
+def previous(
+    notifications: list[dict], limit: int, newer_than: tuple[str, str]
+) -> list[dict]:
+    page = heapq.nsmallest(
+        limit, (n for n in notifications if sort_key(n) > newer_than), key=sort_key
+    )
+
+    return page[::-1]
+
+
+def newer_than(notifications: list[dict], key: tuple[str, str] | None) -> list[dict]:
+    if key is None:
+        return notifications
+
+    return [n for n in notifications if sort_key(n) > key]
+
+
+def find_key(notifications: list[dict], id: str) -> tuple[str, str] | None:
+    for notification in notifications:
+        if notification.get("_id") == id:
+            return sort_key(notification)
+
+    return None
+
+
+def format_notification(notification: dict) -> str:
+    datetime_object = datetime.datetime.fromisoformat(
+        notification.get("created_at")[:-1]
+    )
+
+    formated_time = datetime_object.strftime("%Y-%m-%d %H:%M:%S")
+
+    # Sent as HTML: hbold escapes its text, the message has to be escaped too
+    message = html.escape(str(notification.get("message")), quote=False)
+
+    return f"{message}\n{hbold(formated_time)} from {hbold(notification.get('created_by'))}\n"
+
+
+async def get_mark(name: str, user_id: int) -> tuple[str, str] | None:
+    value = await r.hget(name, user_id)
+
+    if not value:
+        return None
+
+    created_at, _, id = value.decode("utf-8").partition("|")
+    return (created_at, id)
+
+
+async def set_mark(name: str, user_id: int, key: tuple[str, str]) -> None:
+    await r.hset(name, user_id, "|".join(key))
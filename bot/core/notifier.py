@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import time
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError, TelegramForbiddenError
+from redis.exceptions import RedisError
+
+from bot.core import api, config, notifications
+from bot.core.outbox import OutboxFull, OutboxStopped, background
+from bot.core.redis import get_subscribed_users, get_user, r, unsubscribe
+from bot.core.text import split_message
+from bot.core.tokens import token_manager
+
+# Only one bot process polls per interval
+POLL_LOCK_KEY = "apexid:notifier:lock"
+
+
+class NotificationPoller:
+    """
+    Periodically fetches notifications of subscribed users and pushes the
+    ones newer than what the user was last pushed, in the outbox's
+    background lane.
+    """
+
+    def __init__(self) -> None:
+        self.checked = 0
+        self.pushed = 0
+        self.dropped = 0
+        self._task: asyncio.Task | None = None
+
+    async def start(self, bot: Bot) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+        self._task = None
+
+    def stats(self) -> dict[str, int]:
+        return {"checked": self.checked, "pushed": self.pushed, "dropped": self.dropped}
+
+    async def _run(self, bot: Bot) -> None:
+        interval = config.settings.NOTIFIER_INTERVAL
+
+        while True:
+            started = time.monotonic()
+
+            try:
+                if await r.set(POLL_LOCK_KEY, 1, nx=True, px=int(interval * 1000)):
+                    await self.poll(bot)
+            except RedisError:
+                logging.exception("Notification poller could not reach Redis")
+            except Exception:
+                # One bad subscriber must not stop every later poll
+                logging.exception("Notification poller failed")
+
+            await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+
+    async def poll(self, bot: Bot) -> None:
+        slots = asyncio.Semaphore(config.settings.NOTIFIER_CONCURRENCY)
+        tasks: set[asyncio.Task] = set()
+
+        async for user_id in get_subscribed_users():
+            await slots.acquire()
+
+            task = asyncio.create_task(self._check(bot, user_id))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            task.add_done_callback(lambda _: slots.release())
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _check(self, bot: Bot, user_id: int) -> None:
+        try:
+            await self.check(bot, user_id)
+        except Exception:
+            logging.exception("Could not check notifications of %s", user_id)
+
+    async def check(self, bot: Bot, user_id: int) -> None:
+        self.checked += 1
+
+        user = await get_user(user_id)
+
+        if not user:
+            await unsubscribe(user_id)
+            return
+
+        try:
+            response = await api.get_notifications(user.get("token"))
+        except api.Unauthorized as e:
+            # Logging out also drops the subscription
+            await token_manager.invalidate(user_id, e.token)
+            return
+        except api.Unavailable:
+            # Checked again next round, once ApexID has recovered
+            return
+
+        if response.status_code != 200:
+            return
+
+        notifications_data = response.json() or []
+
+        if not notifications_data:
+            return
+
+        newest = notifications.sort_key(
+            max(notifications_data, key=notifications.sort_key)
+        )
+        mark = await notifications.get_mark(notifications.PUSHED_KEY, user_id)
+
+        # First poll after subscribing: start from now, don't replay history
+        new = [] if mark is None else notifications.newer_than(notifications_data, mark)
+
+        if new:
+            parts = [
+                "You have new notifications:\n",
+                *map(
+                    notifications.format_notification,
+                    sorted(new, key=notifications.sort_key),
+                ),
+            ]
+
+            try:
+                with background():
+                    for chunk in split_message(parts):
+                        await bot.send_message(user_id, chunk)
+            except TelegramForbiddenError:
+                # The user blocked the bot
+                await unsubscribe(user_id)
+            except (OutboxFull, OutboxStopped, TelegramAPIError):
+                # Not retried: the mark below moves on either way
+                self.dropped += len(new)
+            else:
+                self.pushed += len(new)
+
+        if newest != mark:
+            await notifications.set_mark(notifications.PUSHED_KEY, user_id, newest)
+
+
+notification_poller = NotificationPoller()
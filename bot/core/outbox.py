@@ -0,0 +1,314 @@
+import asyncio
+import itertools
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import (
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+from aiogram.methods import (
+    EditMessageCaption,
+    EditMessageReplyMarkup,
+    EditMessageText,
+    TelegramMethod,
+)
+
+from bot.core import config
+from bot.core.cache import TTLCache
+from bot.core.ratelimit import TokenBucket
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+_priority: ContextVar[int] = ContextVar("outbox_priority", default=INTERACTIVE)
+
+
+@contextmanager
+def background():
+    """Sends made inside the block yield to interactive replies."""
+
+    token = _priority.set(BACKGROUND)
+
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class OutboxFull(Exception):
+    pass
+
+
+class OutboxStopped(Exception):
+    """The outbox stopped before the call could be sent."""
+
+
+@dataclass(order=True)
+class _Job:
+    priority: int
+    seq: int
+    enqueued_at: float = field(compare=False)
+    chat_id: int | str = field(compare=False)
+    make_request: NextRequestMiddlewareType = field(compare=False)
+    bot: Bot = field(compare=False)
+    method: TelegramMethod = field(compare=False)
+    future: asyncio.Future = field(compare=False)
+    edit_key: tuple | None = field(compare=False, default=None)
+
+
+class Outbox(BaseRequestMiddleware):
+    """
+    Request middleware that routes every chat-bound Bot API call through one
+    queue.
+
+    Calls are released under a global and a per-chat token bucket, with
+    interactive replies ahead of background pushes. Edits of a message that
+    is still queued replace the queued edit, and flood control and transient
+    network errors are retried. Calls without a chat (getUpdates,
+    answerCallbackQuery, ...) go straight through.
+    """
+
+    def __init__(self) -> None:
+        self._queue: asyncio.PriorityQueue[_Job] = asyncio.PriorityQueue()
+        self._edits: dict[tuple, _Job] = {}
+        self._seq = itertools.count()
+        self._global = TokenBucket(
+            rate=config.settings.OUTBOX_GLOBAL_RATE,
+            capacity=config.settings.OUTBOX_GLOBAL_RATE,
+        )
+        # A chat idle for a minute has a full bucket anyway
+        self._chats = TTLCache(maxsize=100_000, ttl=60)
+        self._background = 0
+        self._sending: set[asyncio.Task] = set()
+        # Jobs waiting for their chat's bucket, by seq
+        self._deferred: dict[int, tuple[_Job, asyncio.TimerHandle]] = {}
+        self._task: asyncio.Task | None = None
+
+        self.dispatched = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.retried = 0
+        self.coalesced = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType,
+        bot: Bot,
+        method: TelegramMethod,
+    ) -> Any:
+        chat_id = getattr(method, "chat_id", None)
+
+        if chat_id is None or self._task is None:
+            return await make_request(bot, method)
+
+        edit_key = None
+
+        if isinstance(
+            method, (EditMessageText, EditMessageCaption, EditMessageReplyMarkup)
+        ):
+            edit_key = (type(method), chat_id, method.message_id)
+
+            if (queued := self._edits.get(edit_key)) is not None:
+                # Only the latest content matters, both callers get its result
+                queued.method = method
+                queued.make_request = make_request
+                self.coalesced += 1
+                return await asyncio.shield(queued.future)
+
+        priority = _priority.get()
+
+        if priority == BACKGROUND:
+            if self._background >= config.settings.OUTBOX_BACKGROUND_LIMIT:
+                self.dropped += 1
+                raise OutboxFull()
+
+            self._background += 1
+
+        job = _Job(
+            priority=priority,
+            seq=next(self._seq),
+            enqueued_at=time.monotonic(),
+            chat_id=chat_id,
+            make_request=make_request,
+            bot=bot,
+            method=method,
+            future=asyncio.get_running_loop().create_future(),
+            edit_key=edit_key,
+        )
+
+        if edit_key is not None:
+            self._edits[edit_key] = job
+
+        self._queue.put_nowait(job)
+
+        return await job.future
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Give queued replies a chance to go out before the session closes
+        try:
+            await asyncio.wait_for(self._drain(), config.settings.OUTBOX_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning("Outbox stopped with %d calls queued", self._queued())
+
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+        self._task = None
+
+        # Nobody reads the queue anymore: whoever waits on a call is told
+        for job, handle in self._deferred.values():
+            handle.cancel()
+            self._fail(job)
+
+        self._deferred.clear()
+
+        while not self._queue.empty():
+            self._fail(self._queue.get_nowait())
+
+    def stats(self) -> dict[str, float]:
+        return {
+            "queued": self._queued(),
+            "queued_background": self._background,
+            "in_flight": len(self._sending),
+            "sent": self.sent,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "retried": self.retried,
+            "coalesced": self.coalesced,
+            "queue_latency_avg": (
+                self.latency_total / self.dispatched if self.dispatched else 0.0
+            ),
+            "queue_latency_max": self.latency_max,
+        }
+
+    def _queued(self) -> int:
+        return self._queue.qsize() + len(self._deferred)
+
+    async def _drain(self) -> None:
+        while self._queued() or self._sending:
+            await asyncio.sleep(0.05)
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+
+        if bucket is None:
+            bucket = TokenBucket(
+                rate=config.settings.OUTBOX_CHAT_RATE,
+                capacity=config.settings.OUTBOX_CHAT_BURST,
+            )
+            self._chats.set(chat_id, bucket)
+
+        return bucket
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            job = await self._queue.get()
+
+            if job.future.done():
+                # The caller went away while it was queued
+                self._finish(job)
+                continue
+
+            bucket = self._chat_bucket(job.chat_id)
+
+            if delay := bucket.delay():
+                # Keeps its place among the chat's calls without blocking others
+                self._deferred[job.seq] = (
+                    job,
+                    loop.call_later(delay, self._requeue, job),
+                )
+                continue
+
+            await self._global.acquire()
+            bucket.consume()
+
+            if job.edit_key is not None:
+                self._edits.pop(job.edit_key, None)
+
+            latency = time.monotonic() - job.enqueued_at
+            self.dispatched += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+            task = asyncio.create_task(self._send(job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, job: _Job) -> None:
+        retries = config.settings.OUTBOX_MAX_RETRIES
+
+        try:
+            for attempt in itertools.count():
+                try:
+                    result = await job.make_request(job.bot, job.method)
+                except TelegramRetryAfter as e:
+                    if attempt >= retries:
+                        raise
+
+                    self.retried += 1
+                    await asyncio.sleep(e.retry_after)
+                except (TelegramNetworkError, TelegramServerError):
+                    if attempt >= retries:
+                        raise
+
+                    self.retried += 1
+                    await asyncio.sleep(
+                        config.settings.OUTBOX_RETRY_BACKOFF
+                        * 2**attempt
+                        * random.uniform(0.5, 1.5)
+                    )
+                else:
+                    self.sent += 1
+
+                    if not job.future.done():
+                        job.future.set_result(result)
+                    return
+        except Exception as e:
+            self.failed += 1
+
+            if not job.future.done():
+                job.future.set_exception(e)
+        finally:
+            self._finish(job)
+
+    def _requeue(self, job: _Job) -> None:
+        del self._deferred[job.seq]
+        self._queue.put_nowait(job)
+
+    def _fail(self, job: _Job) -> None:
+        if not job.future.done():
+            job.future.set_exception(OutboxStopped())
+
+        self._finish(job)
+
+    def _finish(self, job: _Job) -> None:
+        if job.priority == BACKGROUND:
+            self._background -= 1
+
+        if job.edit_key is not None and self._edits.get(job.edit_key) is job:
+            del self._edits[job.edit_key]
+
+
+outbox = Outbox()
@@ -0,0 +1,160 @@
+import asyncio
+import io
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+
+from bot.core import config, metrics
+from bot.core.cache import TTLCache
+
+QR_DECODE = metrics.Histogram("qr_decode_seconds", "QR decode duration in the pool")
+QR_RENDER = metrics.Histogram("qr_render_seconds", "QR render duration in the pool")
+QR_REJECTED = metrics.Counter(
+    "qr_decode_rejected_total", "Decodes refused because the pool was saturated"
+)
+
+
+class QueueFull(Exception):
+    pass
+
+
+_executor: Executor | None = None
+_slots = asyncio.Semaphore(config.settings.QR_QUEUE_SIZE)
+
+# Verification tokens are valid for QR_CODE_TTL, so are their renders
+_rendered = TTLCache(
+    maxsize=config.settings.QR_RENDER_CACHE_SIZE, ttl=config.settings.QR_CODE_TTL
+)
+_file_ids = TTLCache(
+    maxsize=config.settings.QR_RENDER_CACHE_SIZE, ttl=config.settings.QR_CODE_TTL
+)
+
+
+def get_executor() -> Executor:
+    global _executor
+
+    if _executor is None:
+        if config.settings.QR_EXECUTOR == "thread":
+            _executor = ThreadPoolExecutor(
+                max_workers=config.settings.QR_WORKERS, thread_name_prefix="qr"
+            )
+        else:
+            _executor = ProcessPoolExecutor(max_workers=config.settings.QR_WORKERS)
+
+    return _executor
+
+
+def _warm() -> None:
+    import qrcode  # noqa: F401
+    from PIL import Image  # noqa: F401
+    from pyzbar import pyzbar  # noqa: F401
+
+
+async def prewarm() -> None:
+    # Returns right away, updates are served while the workers warm up
+    for _ in range(config.settings.QR_WORKERS):
+        get_executor().submit(_warm)
+
+
+def shutdown() -> None:
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+
+    _executor = None
+
+
+def decode_image(data: bytes, max_side: int) -> list[str]:
+    # Imported on first use: pyzbar loads the native zbar library, neither
+    # is needed to start serving updates
+    from PIL import Image
+    from pyzbar.pyzbar import decode as zbar_decode
+
+    image = Image.open(io.BytesIO(data))
+
+    # Cheap pass first: a grayscale, downscaled copy is enough for most photos
+    preview = image.convert("L")
+
+    if max_side and max(preview.size) > max_side:
+        preview.thumbnail((max_side, max_side))
+
+    symbols = zbar_decode(preview)
+
+    if not symbols:
+        symbols = zbar_decode(image)
+
+    return [symbol.data.decode("utf-8", errors="replace") for symbol in symbols]
+
+
+async def decode(data: bytes) -> list[str]:
+    """
+    Decodes every QR code in the image off the event loop.
+
+    Raises ``QueueFull`` when the pool is saturated for longer than
+    ``QR_QUEUE_TIMEOUT`` so callers can shed load instead of piling up.
+    """
+
+    try:
+        await asyncio.wait_for(_slots.acquire(), config.settings.QR_QUEUE_TIMEOUT)
+    except asyncio.TimeoutError:
+        QR_REJECTED.inc()
+        raise QueueFull()
+
+    try:
+        with QR_DECODE.time():
+            return await asyncio.get_running_loop().run_in_executor(
+                get_executor(), decode_image, data, config.settings.QR_DOWNSCALE_SIZE
+            )
+    finally:
+        _slots.release()
+
+
+def pick_photo_size(photos: list):
+    # Telegram lists photo sizes from the smallest to the largest
+    for photo in photos:
+        if min(photo.width, photo.height) >= config.settings.QR_PHOTO_MIN_SIDE:
+            return photo
+
+    return photos[-1]
+
+
+def render_image(data: str, box_size: int, border: int) -> bytes:
+    import qrcode
+
+    code = qrcode.QRCode(box_size=box_size, border=border)
+    code.add_data(data)
+    code.make(fit=True)
+
+    # 1-bit palette keeps the PNG a few hundred bytes
+    image = code.make_image().get_image().convert("1")
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+
+    return buffer.getvalue()
+
+
+async def render(data: str) -> bytes:
+    png = _rendered.get(data)
+
+    if png is None:
+        with QR_RENDER.time():
+            png = await asyncio.get_running_loop().run_in_executor(
+                get_executor(),
+                render_image,
+                data,
+                config.settings.QR_BOX_SIZE,
+                config.settings.QR_BORDER,
+            )
+        _rendered.set(data, png)
+
+    return png
+
+
+def cached_file_id(data: str) -> str | None:
+    return _file_ids.get(data)
+
+
+def remember_file_id(data: str, file_id: str) -> None:
+    # Telegram keeps the upload, the PNG itself is no longer needed
+    _file_ids.set(data, file_id)
+    _rendered.pop(data)
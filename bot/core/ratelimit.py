@@ -0,0 +1,40 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Allows ``rate`` operations per second with bursts of up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def delay(self) -> float:
+        """Seconds until a token is available, 0 if one is available now."""
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    def consume(self) -> None:
+        self.tokens -= 1
+
+    def try_acquire(self) -> bool:
+        if self.delay() > 0:
+            return False
+
+        self.consume()
+        return True
+
+    async def acquire(self) -> None:
+        while (delay := self.delay()) > 0:
+            await asyncio.sleep(delay)
+
+        self.consume()
@@ -1,52 +1,209 @@
-import redis
+import asyncio
 import json
+import time
 
-r = redis.Redis(
-    host="localhost",
-    port=6379,
+from redis import asyncio as aioredis
+
+from bot.core import config, metrics
+from bot.core.responses import response_cache
+from bot.core.session import pack, session_cache, unpack
+
+REDIS_LATENCY = metrics.Histogram(
+    "redis_command_seconds",
+    "Redis command duration, by command",
+    labels=("command",),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0),
+)
+
+
+class InstrumentedRedis(aioredis.Redis):
+    async def execute_command(self, *args, **options):
+        with REDIS_LATENCY.time(args[0]):
+            return await super().execute_command(*args, **options)
+
+
+pool = aioredis.BlockingConnectionPool.from_url(
+    config.settings.REDIS_URL,
+    max_connections=config.settings.REDIS_MAX_CONNECTIONS,
+    timeout=config.settings.REDIS_POOL_TIMEOUT,
+    socket_timeout=config.settings.REDIS_SOCKET_TIMEOUT,
 )
 
+r = InstrumentedRedis(connection_pool=pool)
+
+SUBSCRIBERS_KEY = "apexid:subscribers"
+# Index of logged in users, swept by bot.core.tokens
+SESSIONS_KEY = "apexid:sessions"
+SESSION_KEY = "apexid:session"
+
+
+async def close() -> None:
+    await r.aclose()
+    await pool.disconnect()
+
+
+async def ping():
+    return await r.ping()
 
-def ping():
-    return r.ping()
 
+def session_key(id: str) -> str:
+    return f"{SESSION_KEY}:{id}"
 
-def get_user(id: str):
-    dict_bytes = r.get(id)
 
-    if not dict_bytes:
+def _session_ttl(data: dict) -> int:
+    # Kept a while past the token's expiry so the user is told it expired
+    # rather than that they never logged in
+    expires_at = data.get("token_expires_at")
+
+    if expires_at is None:
+        ttl = config.settings.SESSION_TTL
+    else:
+        ttl = expires_at - time.time() + config.settings.SESSION_EXPIRED_GRACE
+
+    return max(int(ttl * 1000), 1)
+
+
+async def _migrate(id: str, raw: bytes | None) -> dict:
+    # Sessions written before the versioned schema: JSON under the bare id
+    if not raw:
         return {}
 
-    dict_str = dict_bytes.decode("utf-8")
+    data = json.loads(raw)
+
+    async with r.pipeline(transaction=True) as pipe:
+        # NX: a login that happened meanwhile wins over the old blob
+        pipe.set(session_key(id), pack(data), px=_session_ttl(data), nx=True)
+        pipe.sadd(SESSIONS_KEY, id)
+        pipe.delete(id)
+        await pipe.execute()
+
+    return data
+
+
+async def get_user(id: str, renew: bool = False) -> dict:
+    """
+    The user's session, {} if there is none. ``renew`` marks the user as
+    active: a session whose token expiry is unknown lasts SESSION_TTL from
+    its user's last update rather than from the login.
+    """
+
+    raw = await r.get(session_key(id))
+
+    if raw:
+        data = unpack(raw)
+
+        if renew and data.get("token_expires_at") is None:
+            await r.pexpire(session_key(id), _session_ttl(data))
+
+        return data
+
+    return await _migrate(id, await r.get(id))
+
+
+async def get_users(ids: list) -> list[dict]:
+    # One round-trip for a whole batch, {} for the missing ones
+    users = [
+        unpack(raw) if raw else {}
+        for raw in await r.mget([session_key(id) for id in ids])
+    ]
+    missing = [i for i, user in enumerate(users) if not user]
+
+    if missing:
+        legacy = await r.mget([ids[i] for i in missing])
+
+        for i, raw in zip(missing, legacy):
+            users[i] = await _migrate(ids[i], raw)
+
+    return users
+
+
+async def migrate_sessions(batch: int = 500) -> int:
+    """
+    Converts every legacy JSON session in one pass instead of waiting for
+    its owner to show up, returns how many were converted.
+    """
+
+    migrated = 0
+    ids: list[bytes] = []
+
+    async def flush() -> int:
+        users = await asyncio.gather(
+            *(_migrate(id.decode(), raw) for id, raw in zip(ids, await r.mget(ids)))
+        )
+        ids.clear()
+        return sum(1 for user in users if user)
+
+    # Legacy keys are the bare, all-digit Telegram user ids
+    async for key in r.scan_iter(match="[0-9]*", count=batch):
+        if key.isdigit():
+            ids.append(key)
+
+        if len(ids) >= batch:
+            migrated += await flush()
+
+    if ids:
+        migrated += await flush()
+
+    return migrated
+
+
+async def set_user(id: str, data: dict):
+    async with r.pipeline(transaction=True) as pipe:
+        pipe.set(session_key(id), pack(data), px=_session_ttl(data))
+        pipe.sadd(SESSIONS_KEY, id)
+        await pipe.execute()
+
+    session_cache.pop(id)
+    response_cache.invalidate(id)
+
+
+async def logout(id: str):
+    async with r.pipeline(transaction=True) as pipe:
+        # The bare id is where sessions lived before the versioned schema
+        pipe.delete(session_key(id), id)
+        pipe.srem(SUBSCRIBERS_KEY, id)
+        pipe.srem(SESSIONS_KEY, id)
+        await pipe.execute()
+
+    session_cache.pop(id)
+    response_cache.invalidate(id)
+
 
-    my_dict = json.loads(dict_str)
+async def get_subscribed_users():
+    async for id in r.sscan_iter(SUBSCRIBERS_KEY):
+        # As in get_session_ids, members that aren't user ids are skipped
+        if id.isdigit():
+            yield int(id)
 
-    return my_dict
 
+async def get_session_ids():
+    async for id in r.sscan_iter(SESSIONS_KEY):
+        # Only user ids are swept, not e.g. the keys a benchmark left behind
+        if id.isdigit():
+            yield int(id)
 
-# def get_subscribed_users():
-#     return [get_user(id) for id in r.keys() if get_user(id).get("is_subscribed")]
 
+async def forget_session(id: str) -> None:
+    await r.srem(SESSIONS_KEY, id)
 
-def set_user(id: str, data: dict):
-    r.set(id, bytes(json.dumps(data), "utf-8"))
 
+async def is_subscribed(id: str) -> bool:
+    return bool(await r.sismember(SUBSCRIBERS_KEY, id))
 
-def logout(id: str):
-    r.delete(id)
 
+async def unsubscribe(id: str) -> None:
+    await r.srem(SUBSCRIBERS_KEY, id)
 
-# def is_subscribed(id: str) -> bool:
-#     return bool(get_user(id).get("is_subscribed"))
 
+async def toggle_subscription(id: str) -> bool:
+    # SADD reports 0 when the user was already there
+    if await r.sadd(SUBSCRIBERS_KEY, id):
+        return True
 
-# def toggle_subscription(id: str) -> bool:
-#     _user = get_user(id)
-#     _user["is_subscribed"] = not bool(_user["is_subscribed"])
-#     set_user(id, _user)
+    await unsubscribe(id)
 
-#     return _user["is_subscribed"]
+    return False
 
 
-def is_user_exist(id: int) -> bool:
-    return bool(get_user(id))
+async def is_user_exist(id: int) -> bool:
+    return bool(await get_user(id))
@@ -0,0 +1,132 @@
+import asyncio
+import random
+import time
+from collections import deque
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures and refuses calls for
+    ``reset_timeout`` seconds. After that a single probe call is let
+    through: its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, threshold: int, reset_timeout: float) -> None:
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe_started: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        return self.opened_at is not None
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+
+        now = time.monotonic()
+
+        if now - self.opened_at < self.reset_timeout:
+            return False
+
+        # A probe that never reported back doesn't keep the breaker stuck
+        if (
+            self._probe_started is not None
+            and now - self._probe_started < self.reset_timeout
+        ):
+            return False
+
+        self._probe_started = now
+
+        return True
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self._probe_started = None
+
+    def failure(self) -> None:
+        self.failures += 1
+        self._probe_started = None
+
+        if self.opened_at is not None or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency limit: every call answered within ``target`` seconds
+    raises it by ``1 / limit`` (about one per round of calls), a slow or
+    failed one multiplies it by ``decrease``, at most once per ``target`` so
+    that a burst of slow calls counts once. Calls over the limit wait their
+    turn.
+    """
+
+    def __init__(
+        self,
+        initial: float,
+        minimum: float,
+        maximum: float,
+        target: float,
+        decrease: float = 0.9,
+    ) -> None:
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target = target
+        self.decrease = decrease
+        self.in_flight = 0
+        self.rejected = 0
+        self._waiters: deque[asyncio.Future] = deque()
+        self._decreased = 0.0
+
+    async def acquire(self, timeout: float) -> bool:
+        """Takes a slot, ``False`` if none frees up within ``timeout``."""
+
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return True
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            # Handed a slot right before being cancelled
+            if waiter.done() and not waiter.cancelled():
+                self.in_flight -= 1
+                self._wake()
+            raise
+
+        return True
+
+    def release(self, latency: float, ok: bool) -> None:
+        self.in_flight -= 1
+
+        if ok and latency <= self.target:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        elif time.monotonic() - self._decreased >= self.target:
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            self._decreased = time.monotonic()
+
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+
+            # Timed out or cancelled meanwhile
+            if not waiter.done():
+                waiter.set_result(None)
+                self.in_flight += 1
+
+
+def backoff(attempt: int, base: float) -> float:
+    # Full jitter: retries of many callers don't arrive in lockstep
+    return random.uniform(0, base * 2**attempt)
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+
+from bot.core import api, config
+from bot.core.cache import ResponseCache
+
+response_cache = ResponseCache(maxsize=config.settings.RESPONSE_CACHE_SIZE)
+
+# What users open right after logging in, fetched alongside their profile:
+# the upstream call and the fresh TTL of its cache entry
+PREFETCHED = {
+    "notifications": (
+        api.get_notifications,
+        lambda: config.settings.RESPONSE_CACHE_TTL_NOTIFICATIONS,
+    ),
+    "cabinet": (api.cabinet, lambda: config.settings.RESPONSE_CACHE_TTL_CABINET),
+    "documents": (
+        api.get_documets,
+        lambda: config.settings.RESPONSE_CACHE_TTL_DOCUMENTS,
+    ),
+}
+
+
+def _consume(task: asyncio.Task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+async def prefetch(
+    token: str, timeout: float
+) -> tuple[api.Response, dict[str, api.Response]]:
+    """
+    Fetches the profile and the PREFETCHED endpoints concurrently. The
+    profile is always waited for; the rest only until ``timeout`` seconds
+    after the start, whatever hasn't arrived by then is dropped.
+    """
+
+    deadline = time.monotonic() + timeout
+    tasks = {
+        endpoint: asyncio.create_task(fetch(token))
+        for endpoint, (fetch, _) in PREFETCHED.items()
+    }
+    done: set[asyncio.Task] = set()
+
+    try:
+        profile = await api.get_profile(token)
+
+        if profile.status_code == 200:
+            done, _ = await asyncio.wait(
+                tasks.values(), timeout=max(deadline - time.monotonic(), 0)
+            )
+    finally:
+        for task in tasks.values():
+            task.cancel()
+            # Read when dropped, so a failure isn't reported as never retrieved
+            task.add_done_callback(_consume)
+
+    prefetched = {}
+
+    for endpoint, task in tasks.items():
+        if task not in done:
+            continue
+
+        if task.exception() is not None:
+            logging.warning("Prefetching %s failed: %r", endpoint, task.exception())
+            continue
+
+        prefetched[endpoint] = task.result()
+
+    return profile, prefetched
+
+
+def warm_up(user_id: int, token: str, prefetched: dict[str, api.Response]) -> None:
+    # After set_user: storing a session invalidates what was cached before
+    for endpoint, response in prefetched.items():
+        response_cache.put(
+            user_id,
+            endpoint,
+            token,
+            value=response,
+            ttl=PREFETCHED[endpoint][1](),
+            stale_ttl=config.settings.RESPONSE_CACHE_STALE_TTL,
+        )
+
+
+async def get_notifications(user_id: int, token: str) -> api.Response:
+    return await response_cache.get(
+        user_id,
+        "notifications",
+        api.get_notifications,
+        token,
+        ttl=config.settings.RESPONSE_CACHE_TTL_NOTIFICATIONS,
+        stale_ttl=config.settings.RESPONSE_CACHE_STALE_TTL,
+    )
+
+
+async def cabinet(user_id: int, token: str) -> api.Response:
+    return await response_cache.get(
+        user_id,
+        "cabinet",
+        api.cabinet,
+        token,
+        ttl=config.settings.RESPONSE_CACHE_TTL_CABINET,
+        stale_ttl=config.settings.RESPONSE_CACHE_STALE_TTL,
+    )
+
+
+async def get_documets(user_id: int, token: str) -> api.Response:
+    return await response_cache.get(
+        user_id,
+        "documents",
+        api.get_documets,
+        token,
+        ttl=config.settings.RESPONSE_CACHE_TTL_DOCUMENTS,
+        stale_ttl=config.settings.RESPONSE_CACHE_STALE_TTL,
+    )
+
+
+async def get_document(user_id: int, token: str, id: str) -> api.Response:
+    return await response_cache.get(
+        user_id,
+        "document",
+        api.get_document,
+        token,
+        id,
+        ttl=config.settings.RESPONSE_CACHE_TTL_DOCUMENT,
+        stale_ttl=config.settings.RESPONSE_CACHE_STALE_TTL,
+    )
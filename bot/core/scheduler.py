@@ -0,0 +1,135 @@
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramAPIError
+from redis.exceptions import RedisError
+
+from bot.core import config
+from bot.core.outbox import OutboxFull, OutboxStopped, background
+from bot.core.redis import r
+
+DELETIONS_KEY = "apexid:deletions"
+
+# Telegram's deleteMessages accepts at most 100 ids per call
+DELETE_MESSAGES_LIMIT = 100
+
+
+async def schedule_deletion(chat_id: int, message_id: int, delay: float) -> None:
+    await r.zadd(DELETIONS_KEY, {f"{chat_id}:{message_id}": time.time() + delay})
+
+
+class DeletionScheduler:
+    """
+    Deletes scheduled messages when they come due.
+
+    Pending deletions live in a Redis sorted set scored by due time, so they
+    survive restarts and can be shared by several bot processes: a member is
+    only deleted by the worker whose ``ZREM`` removed it.
+    """
+
+    def __init__(self) -> None:
+        self.deleted = 0
+        self.failed = 0
+        self._task: asyncio.Task | None = None
+
+    async def start(self, bot: Bot) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(bot))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+        self._task = None
+
+    async def stats(self) -> dict[str, int]:
+        pending, overdue = await asyncio.gather(
+            r.zcard(DELETIONS_KEY), r.zcount(DELETIONS_KEY, "-inf", time.time())
+        )
+
+        return {
+            "pending": pending,
+            "overdue": overdue,
+            "deleted": self.deleted,
+            "failed": self.failed,
+        }
+
+    async def _run(self, bot: Bot) -> None:
+        while True:
+            try:
+                delay = await self.tick(bot)
+            except RedisError:
+                logging.exception("Deletion scheduler could not reach Redis")
+                delay = config.settings.DELETION_INTERVAL
+            except Exception:
+                # Whatever went wrong, the next tick is worth trying
+                logging.exception("Deletion scheduler failed")
+                delay = config.settings.DELETION_INTERVAL
+
+            await asyncio.sleep(delay)
+
+    async def tick(self, bot: Bot) -> float:
+        """Deletes one batch of due messages, returns how long to sleep."""
+
+        now = time.time()
+        batch_size = config.settings.DELETION_BATCH_SIZE
+
+        members = await r.zrangebyscore(
+            DELETIONS_KEY, "-inf", now, start=0, num=batch_size
+        )
+
+        if members:
+            await self._delete(bot, await self._claim(members))
+
+            if len(members) == batch_size:
+                return 0
+
+        upcoming = await r.zrange(DELETIONS_KEY, 0, 0, withscores=True)
+
+        if not upcoming:
+            return config.settings.DELETION_INTERVAL
+
+        return min(max(upcoming[0][1] - now, 0), config.settings.DELETION_INTERVAL)
+
+    async def _claim(self, members: list[bytes]) -> list[bytes]:
+        async with r.pipeline(transaction=False) as pipe:
+            for member in members:
+                pipe.zrem(DELETIONS_KEY, member)
+
+            removed = await pipe.execute()
+
+        return [member for member, claimed in zip(members, removed) if claimed]
+
+    async def _delete(self, bot: Bot, members: list[bytes]) -> None:
+        by_chat: dict[int, list[int]] = defaultdict(list)
+
+        for member in members:
+            chat_id, message_id = member.decode().split(":")
+            by_chat[int(chat_id)].append(int(message_id))
+
+        for chat_id, message_ids in by_chat.items():
+            for i in range(0, len(message_ids), DELETE_MESSAGES_LIMIT):
+                chunk = message_ids[i : i + DELETE_MESSAGES_LIMIT]
+
+                try:
+                    with background():
+                        await bot.delete_messages(chat_id, chunk)
+                    self.deleted += len(chunk)
+                except (OutboxFull, OutboxStopped):
+                    # Claimed already: put back, to be retried next interval
+                    due = time.time() + config.settings.DELETION_INTERVAL
+                    await r.zadd(
+                        DELETIONS_KEY,
+                        {f"{chat_id}:{message_id}": due for message_id in chunk},
+                    )
+                except TelegramAPIError:
+                    # Usually already deleted by the user or too old to delete
+                    logging.warning("Could not delete %s in chat %s", chunk, chat_id)
+                    self.failed += len(chunk)
+
+
+deletion_scheduler = DeletionScheduler()
@@ -0,0 +1,51 @@
+from dataclasses import asdict, dataclass, fields
+
+import msgpack
+
+from bot.core import config
+from bot.core.cache import TTLCache
+
+
+@dataclass(frozen=True, slots=True)
+class Session:
+    id: str | None = None
+    email: str | None = None
+    first_name: str | None = None
+    token: str | None = None
+    token_expires_at: float | None = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Session":
+        return cls(**{f.name: data.get(f.name) for f in fields(cls)})
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+# Stored sessions are msgpack arrays led by their schema version, so the field
+# names aren't repeated in every value. A new schema appends a version here;
+# older values keep decoding with their own field list.
+SCHEMA_VERSION = 1
+SCHEMA = {
+    1: ("id", "email", "first_name", "token", "token_expires_at"),
+}
+
+
+def pack(data: dict) -> bytes:
+    return msgpack.packb(
+        [SCHEMA_VERSION, *(data.get(name) for name in SCHEMA[SCHEMA_VERSION])]
+    )
+
+
+def unpack(raw: bytes) -> dict:
+    version, *values = msgpack.unpackb(raw)
+
+    return dict(zip(SCHEMA[version], values))
+
+
+# Short-lived copy of decoded sessions, keyed by Telegram user id.
+# Entries are dropped by set_user/logout so a chat never sees a stale login.
+session_cache = TTLCache(
+    maxsize=config.settings.SESSION_CACHE_SIZE,
+    ttl=config.settings.SESSION_CACHE_TTL,
+)
@@ -0,0 +1,26 @@
+import functools
+import json
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+
+from bot.core import config
+from bot.core.redis import r
+
+# FSM data is written on every step of a flow, keep it free of whitespace
+_dumps = functools.partial(json.dumps, separators=(",", ":"), ensure_ascii=False)
+
+
+def create_storage() -> BaseStorage:
+    if config.settings.FSM_STORAGE == "memory":
+        return MemoryStorage()
+
+    # Shares the session store pool; abandoned flows expire on their own
+    return RedisStorage(
+        redis=r,
+        key_builder=DefaultKeyBuilder(prefix="apexid:fsm", with_bot_id=True),
+        state_ttl=config.settings.FSM_STATE_TTL,
+        data_ttl=config.settings.FSM_DATA_TTL,
+        json_dumps=_dumps,
+    )
@@ -0,0 +1,37 @@
+from typing import Iterable
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def split_message(
+    parts: Iterable[str], limit: int = TELEGRAM_MESSAGE_LIMIT, sep: str = "\n"
+) -> list[str]:
+    """Joins ``parts`` into as few messages as possible, each within ``limit``."""
+
+    chunks = []
+    current: list[str] = []
+    size = 0
+
+    for part in parts:
+        # A single oversized part has to be cut, whatever it contains
+        while len(part) > limit:
+            if current:
+                chunks.append(sep.join(current))
+                current, size = [], 0
+
+            chunks.append(part[:limit])
+            part = part[limit:]
+
+        added = len(part) + (len(sep) if current else 0)
+
+        if size + added > limit:
+            chunks.append(sep.join(current))
+            current, size, added = [], 0, len(part)
+
+        current.append(part)
+        size += added
+
+    if current:
+        chunks.append(sep.join(current))
+
+    return chunks
@@ -0,0 +1,229 @@
+import asyncio
+import base64
+import binascii
+import enum
+import json
+import logging
+import time
+
+from redis.exceptions import RedisError
+
+from bot.core import api, config
+from bot.core.redis import (
+    forget_session,
+    get_session_ids,
+    get_user,
+    get_users,
+    logout,
+    r,
+)
+from bot.core.session import Session
+
+# Only one bot process sweeps stored sessions per interval
+VALIDATE_LOCK_KEY = "apexid:tokens:lock"
+# Users already told that their token is about to expire
+WARNED_KEY = "apexid:tokens:warned"
+
+
+class TokenState(enum.Enum):
+    VALID = "valid"
+    EXPIRING = "expiring"
+    EXPIRED = "expired"
+
+
+def _jwt_exp(token: str) -> float | None:
+    # The payload is only read, never trusted: ApexID still has the last word
+    parts = token.removeprefix("Bearer ").split(".")
+
+    if len(parts) != 3:
+        return None
+
+    try:
+        payload = json.loads(
+            base64.urlsafe_b64decode(parts[1] + "=" * (-len(parts[1]) % 4))
+        )
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+    exp = payload.get("exp") if isinstance(payload, dict) else None
+
+    return float(exp) if isinstance(exp, (int, float)) else None
+
+
+def expires_at(token: str | None) -> float | None:
+    # No JWT exp, no known expiry: only ApexID can tell such a token is gone
+    return _jwt_exp(token) if token else None
+
+
+class TokenManager:
+    """
+    Keeps track of when ApexID tokens expire: sessions are flagged before
+    their token runs out, dropped once it did or once ApexID rejects it, and
+    stored sessions are swept in the background so stale ones go away
+    without user traffic.
+
+    There is no refresh endpoint, so "refreshing" a token means asking the
+    user to /login again while the old one still works.
+    """
+
+    def __init__(self) -> None:
+        self.checked = 0
+        self.expired = 0
+        self.rejected = 0
+        self.invalidated = 0
+        self._invalidating: dict[tuple[int, str], asyncio.Task] = {}
+        self._task: asyncio.Task | None = None
+
+    def expires_at(self, session: Session) -> float | None:
+        # Read from the token itself: sessions stored by earlier releases
+        # carry an assumed expiry for tokens without a JWT exp
+        return expires_at(session.token)
+
+    def state(self, session: Session, now: float | None = None) -> TokenState:
+        exp = self.expires_at(session)
+
+        if exp is None:
+            return TokenState.VALID
+
+        remaining = exp - (time.time() if now is None else now)
+
+        if remaining <= config.settings.TOKEN_EXPIRY_SKEW:
+            return TokenState.EXPIRED
+
+        if remaining <= config.settings.TOKEN_REFRESH_MARGIN:
+            return TokenState.EXPIRING
+
+        return TokenState.VALID
+
+    async def warn_once(self, user_id: int, session: Session) -> bool:
+        # The flag lives as long as the token, a new login starts over
+        ttl = max(self.expires_at(session) - time.time(), 1)
+
+        return bool(
+            await r.set(f"{WARNED_KEY}:{user_id}", 1, nx=True, px=int(ttl * 1000))
+        )
+
+    async def invalidate(self, user_id: int, token: str) -> bool:
+        """
+        Logs the user out if their stored session still holds ``token``.
+        Concurrent calls for the same token share one Redis round-trip, and
+        a session from a newer login is left alone.
+        """
+
+        key = (user_id, token)
+        task = self._invalidating.get(key)
+
+        if task is not None:
+            await asyncio.shield(task)
+            return False
+
+        task = asyncio.create_task(self._invalidate(user_id, token))
+        self._invalidating[key] = task
+        task.add_done_callback(lambda _: self._invalidating.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    async def _invalidate(self, user_id: int, token: str) -> bool:
+        user = await get_user(user_id)
+
+        if user.get("token") != token:
+            return False
+
+        await logout(user_id)
+        self.invalidated += 1
+
+        return True
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+        self._task = None
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "checked": self.checked,
+            "expired": self.expired,
+            "rejected": self.rejected,
+            "invalidated": self.invalidated,
+        }
+
+    async def _run(self) -> None:
+        interval = config.settings.TOKEN_VALIDATION_INTERVAL
+
+        while True:
+            started = time.monotonic()
+
+            try:
+                if await r.set(VALIDATE_LOCK_KEY, 1, nx=True, px=int(interval * 1000)):
+                    await self.sweep()
+            except RedisError:
+                logging.exception("Token validator could not reach Redis")
+            except Exception:
+                # A malformed stored session must not stop every later sweep
+                logging.exception("Token validator failed")
+
+            await asyncio.sleep(max(interval - (time.monotonic() - started), 0))
+
+    async def sweep(self) -> None:
+        batch: list[int] = []
+
+        async for user_id in get_session_ids():
+            batch.append(user_id)
+
+            if len(batch) >= config.settings.TOKEN_VALIDATION_BATCH:
+                await self.validate(batch)
+                batch = []
+
+        if batch:
+            await self.validate(batch)
+
+    async def validate(self, user_ids: list[int]) -> None:
+        now = time.time()
+        alive: list[tuple[int, Session]] = []
+
+        for user_id, user in zip(user_ids, await get_users(user_ids)):
+            self.checked += 1
+
+            if not user:
+                # Logged out some other way, e.g. an older release
+                await forget_session(user_id)
+                continue
+
+            session = Session.from_dict(user)
+
+            if session.token and self.state(session, now) is not TokenState.EXPIRED:
+                alive.append((user_id, session))
+                continue
+
+            self.expired += 1
+            await logout(user_id)
+
+        if config.settings.TOKEN_VALIDATION_UPSTREAM and alive:
+            slots = asyncio.Semaphore(config.settings.TOKEN_VALIDATION_CONCURRENCY)
+            await asyncio.gather(
+                *(self._probe(slots, user_id, session) for user_id, session in alive)
+            )
+
+    async def _probe(
+        self, slots: asyncio.Semaphore, user_id: int, session: Session
+    ) -> None:
+        async with slots:
+            try:
+                await api.get_profile(session.token)
+            except api.Unauthorized:
+                self.rejected += 1
+                await self.invalidate(user_id, session.token)
+            except api.Unavailable:
+                # Probed again next sweep
+                return
+            except Exception:
+                logging.exception("Could not validate the token of %s", user_id)
+
+
+token_manager = TokenManager()
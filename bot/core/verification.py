@@ -0,0 +1,210 @@
+import asyncio
+import html
+import re
+
+from aiogram.types import Message
+
+from bot.core import api, config, documents
+from bot.core.cache import TTLCache
+from bot.core.ratelimit import TokenBucket
+from bot.core.text import split_message
+
+CODE = re.compile(r"^[a-f\d]{24}$")
+
+
+def is_code(data: str) -> bool:
+    return CODE.match(data) is not None
+
+
+class MediaGroupCollector:
+    """
+    Telegram delivers every photo of an album as its own update. The first
+    one to arrive waits until ``window`` seconds pass without another photo
+    of its group and gets the whole album back; the others get ``None``.
+    """
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self._groups: dict[str, list[Message]] = {}
+
+    async def collect(self, message: Message) -> list[Message] | None:
+        group = self._groups.get(message.media_group_id)
+
+        if group is not None:
+            group.append(message)
+            return None
+
+        group = self._groups[message.media_group_id] = [message]
+
+        try:
+            size = 0
+
+            while size != len(group):
+                size = len(group)
+                await asyncio.sleep(self.window)
+        finally:
+            del self._groups[message.media_group_id]
+
+        return group
+
+
+class ScanLimiter:
+    """
+    Per-user token buckets for photos to decode, checked before anything is
+    downloaded so that one chat can't flood the QR pool or ApexID.
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.limited = 0
+        # Refreshed on every use: a bucket idle for burst / rate is full anyway
+        self._buckets = TTLCache(maxsize=100_000, ttl=burst / rate)
+        self._warned = TTLCache(maxsize=100_000, ttl=0)
+
+    def _bucket(self, user_id: int) -> TokenBucket:
+        bucket = self._buckets.get(user_id)
+
+        if bucket is None:
+            bucket = TokenBucket(rate=self.rate, capacity=self.burst)
+
+        self._buckets.set(user_id, bucket)
+
+        return bucket
+
+    def admit(self, user_id: int, photos: int) -> int:
+        """Takes a token per photo while there are any, returns how many."""
+
+        bucket = self._bucket(user_id)
+        admitted = 0
+
+        while admitted < photos and bucket.try_acquire():
+            admitted += 1
+
+        self.limited += photos - admitted
+
+        return admitted
+
+    def retry_after(self, user_id: int) -> float:
+        return self._bucket(user_id).delay()
+
+    def should_warn(self, user_id: int) -> bool:
+        # Once per wait, replying to every photo of a flood would be one too
+        if self._warned.get(user_id):
+            return False
+
+        self._warned.set(user_id, True, ttl=max(self.retry_after(user_id), 1))
+
+        return True
+
+    def stats(self) -> dict[str, int]:
+        return {"limited": self.limited, "users": len(self._buckets)}
+
+
+class VerificationCache:
+    """
+    Results of ``api.verify_code`` by code, concurrent lookups of one code
+    share a call. Rejections (4xx) are kept for VERIFY_NEGATIVE_TTL, a code
+    doesn't become valid again. Successes only for VERIFY_CACHE_TTL: a code
+    may be scanned at any point of its QR_CODE_TTL, so a cached success can
+    be answered up to that long after the code itself expired.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self._results = TTLCache(maxsize=maxsize, ttl=0)
+        self._inflight: dict[str, asyncio.Task] = {}
+
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, code: str) -> api.Response:
+        response = self._results.get(code)
+
+        if response is not None:
+            self.hits += 1
+            return response
+
+        self.misses += 1
+        task = self._inflight.get(code)
+
+        if task is None:
+            task = asyncio.create_task(self._fetch(code))
+            task.add_done_callback(lambda _: self._inflight.pop(code, None))
+            self._inflight[code] = task
+
+        # Shielded so a cancelled caller doesn't cancel everyone's lookup
+        return await asyncio.shield(task)
+
+    async def _fetch(self, code: str) -> api.Response:
+        response = await api.verify_code(code)
+
+        if response.status_code == 200:
+            ttl = config.settings.VERIFY_CACHE_TTL
+        elif 400 <= response.status_code < 500 and response.status_code != 429:
+            ttl = config.settings.VERIFY_NEGATIVE_TTL
+        else:
+            # Upstream trouble says nothing about the code
+            return response
+
+        self._results.set(code, response, ttl=ttl)
+
+        return response
+
+    def stats(self) -> dict[str, float]:
+        lookups = self.hits + self.misses
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "size": len(self._results),
+        }
+
+
+scan_limiter = ScanLimiter(
+    rate=config.settings.SCAN_RATE, burst=config.settings.SCAN_BURST
+)
+verification_cache = VerificationCache(maxsize=config.settings.VERIFY_CACHE_SIZE)
+
+
+async def verify_all(codes: list[str]) -> list[tuple[str, api.Response]]:
+    slots = asyncio.Semaphore(config.settings.VERIFY_CONCURRENCY)
+
+    async def verify(code: str) -> tuple[str, api.Response]:
+        async with slots:
+            return code, await verification_cache.get(code)
+
+    return await asyncio.gather(*map(verify, codes))
+
+
+def summary(results: list[tuple[str, api.Response]], rejected: int) -> list[str]:
+    """One report for a whole batch, split only where Telegram requires it."""
+
+    valid = sum(1 for _, response in results if response.status_code == 200)
+    parts = [
+        f"<b>Checked {len(results)} codes: {valid} valid, "
+        f"{len(results) - valid} failed.</b>\n"
+    ]
+
+    for code, response in results:
+        if response.status_code == 200:
+            parts.append(f"Valid: <code>{code}</code>\n")
+            parts.extend(documents.fields(response.json()))
+            continue
+
+        try:
+            detail = response.json().get("detail")
+        except ValueError:
+            detail = None
+
+        parts.append(
+            f"Failed: <code>{code}</code>\n"
+            f"{html.escape(str(detail or 'Verification failed.'), quote=False)}\n"
+        )
+
+    if rejected:
+        parts.append(f"{rejected} QR codes were not verification codes.\n")
+
+    parts.append("This message will be deleted in 3 minutes.")
+
+    return split_message(parts)
@@ -0,0 +1,289 @@
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing.queues
+import signal
+from collections import deque
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from bot.core import config
+from bot.core.middlewares.serialization import SerializationMiddleware
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def sender_id(update: dict) -> int | None:
+    # Every update kind but "update_id" is an object sent by a user, or in
+    # a chat when nobody sent it (channel posts)
+    for value in update.values():
+        if isinstance(value, dict):
+            sender = value.get("from") or value.get("user") or value.get("chat")
+
+            if sender:
+                return sender["id"]
+
+    return None
+
+
+class _Lane:
+    """A user's updates waiting behind the one of theirs being processed."""
+
+    __slots__ = ("updates", "room")
+
+    def __init__(self, update: dict) -> None:
+        self.updates: deque[dict | Update] = deque([update])
+        # Set while there is room for more
+        self.room = asyncio.Event()
+        self.room.set()
+
+
+class WebhookHandler:
+    """
+    Accepts webhook updates and processes them in the background.
+
+    At most ``max_concurrency`` updates are processed at once; when all slots
+    are busy the response is held back, which makes Telegram slow down
+    instead of piling up tasks. A user's updates wait behind the one of
+    theirs being processed without taking a slot, so that a chatty user
+    can't hold every slot while waiting on their own lock
+    (SerializationMiddleware), and at most ``max_pending`` of them do: past
+    that the webhook answers 503. Their callback queries are answered as
+    they arrive all the same. Album photos are let through together, they
+    are collected into one update later.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        secret: str | None,
+        max_concurrency: int,
+        max_pending: int,
+        serialization: SerializationMiddleware | None = None,
+    ) -> None:
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret = secret
+        self.max_pending = max_pending
+        self.serialization = serialization
+        self.accepting = True
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._tasks: set[asyncio.Task] = set()
+        self._pending: dict[int, _Lane] = {}
+
+    async def handle(self, request: web.Request) -> web.Response:
+        if self.secret and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), self.secret
+        ):
+            return web.Response(status=401)
+
+        if not self.accepting:
+            # Telegram redelivers the update to whichever instance is up
+            return web.Response(status=503)
+
+        if not await self.submit(await request.json(), wait=False):
+            # The user has too many updates waiting, Telegram retries later
+            return web.Response(status=503)
+
+        return web.Response()
+
+    async def submit(self, update: dict, wait: bool = True) -> bool:
+        """
+        Queues ``update``, waiting for a slot. When its user already has
+        ``max_pending`` updates waiting, waits for room as well, or returns
+        ``False`` without ``wait``.
+        """
+
+        user_id = sender_id(update)
+
+        if (update.get("message") or {}).get("media_group_id") is not None:
+            user_id = None
+
+        if user_id is None:
+            await self._start(None, _Lane(update))
+            return True
+
+        lane = self._pending.get(user_id)
+
+        if lane is None:
+            lane = self._pending[user_id] = _Lane(update)
+            await self._start(user_id, lane)
+            return True
+
+        if len(lane.updates) >= self.max_pending:
+            if not wait:
+                return False
+
+            await lane.room.wait()
+            return await self.submit(update, wait)
+
+        if "callback_query" in update and self.serialization is not None:
+            # Answered now, not once the user's earlier updates are done
+            parsed = Update.model_validate(update, context={"bot": self.bot})
+
+            if not await self.serialization.accept(parsed.callback_query):
+                return True
+
+            update = parsed
+
+        lane.updates.append(update)
+
+        if len(lane.updates) >= self.max_pending:
+            lane.room.clear()
+
+        return True
+
+    async def _start(self, user_id: int | None, lane: _Lane) -> None:
+        slot = asyncio.get_running_loop().create_future()
+        task = asyncio.create_task(self._process(user_id, lane, slot))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        # Shielded: updates queued behind this one don't depend on the request
+        await asyncio.shield(slot)
+
+    async def _process(
+        self, user_id: int | None, lane: _Lane, slot: asyncio.Future
+    ) -> None:
+        try:
+            await self._slots.acquire()
+            slot.set_result(None)
+
+            try:
+                while lane.updates:
+                    update = lane.updates.popleft()
+                    lane.room.set()
+                    await self._feed(update)
+            finally:
+                self._slots.release()
+        finally:
+            if user_id is not None:
+                del self._pending[user_id]
+
+            # Whoever waits for room starts a new lane
+            lane.room.set()
+
+            if not slot.done():
+                slot.cancel()
+
+    async def _feed(self, update: dict | Update) -> None:
+        try:
+            if isinstance(update, dict):
+                await self.dispatcher.feed_raw_update(self.bot, update)
+            else:
+                await self.dispatcher.feed_update(self.bot, update)
+        except Exception:
+            logging.exception("Failed to process an update")
+
+    async def drain(self, timeout: float) -> None:
+        self.accepting = False
+
+        if not self._tasks:
+            return
+
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+
+        for task in pending:
+            task.cancel()
+
+        if pending:
+            logging.warning("Cancelled %d updates on shutdown", len(pending))
+
+
+async def run_webhook(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    serialization: SerializationMiddleware | None = None,
+) -> None:
+    settings = config.settings
+
+    if not settings.WEBHOOK_URL:
+        raise RuntimeError("WEBHOOK_URL is required when BOT_MODE is webhook")
+
+    handler = WebhookHandler(
+        dispatcher,
+        bot,
+        secret=settings.WEBHOOK_SECRET,
+        max_concurrency=settings.WEBHOOK_MAX_CONCURRENCY,
+        max_pending=settings.WEBHOOK_MAX_PENDING,
+        serialization=serialization,
+    )
+
+    app = web.Application()
+    app.router.add_post(settings.WEBHOOK_PATH, handler.handle)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+
+    workflow_data = {"bot": bot, "dispatcher": dispatcher, **dispatcher.workflow_data}
+    await dispatcher.emit_startup(**workflow_data)
+
+    await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+
+    await bot.set_webhook(
+        url=f"{settings.WEBHOOK_URL}{settings.WEBHOOK_PATH}",
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=dispatcher.resolve_used_update_types(),
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+    )
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    logging.info(
+        "Webhook is listening on %s:%s", settings.WEBHOOK_HOST, settings.WEBHOOK_PORT
+    )
+
+    try:
+        await stopped.wait()
+    finally:
+        # Refuse new updates, let in-flight ones finish, then tear down
+        await handler.drain(settings.WEBHOOK_DRAIN_TIMEOUT)
+        await runner.cleanup()
+        await dispatcher.emit_shutdown(**workflow_data)
+        await bot.session.close()
+
+
+async def run_worker(
+    dispatcher: Dispatcher,
+    bot: Bot,
+    updates: multiprocessing.queues.Queue,
+    serialization: SerializationMiddleware | None = None,
+) -> None:
+    """
+    Processes the updates ``bot.supervisor`` routes to this process, as raw
+    JSON, until it's sent ``None``.
+    """
+
+    settings = config.settings
+
+    handler = WebhookHandler(
+        dispatcher,
+        bot,
+        secret=None,
+        max_concurrency=settings.WEBHOOK_MAX_CONCURRENCY,
+        max_pending=settings.WEBHOOK_MAX_PENDING,
+        serialization=serialization,
+    )
+
+    workflow_data = {"bot": bot, "dispatcher": dispatcher, **dispatcher.workflow_data}
+    await dispatcher.emit_startup(**workflow_data)
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        # The queue blocks, so it's read from a thread. A user with too many
+        # updates waiting holds up reading, the supervisor then answers 503
+        while (raw := await loop.run_in_executor(None, updates.get)) is not None:
+            await handler.submit(json.loads(raw))
+    finally:
+        await handler.drain(settings.WEBHOOK_DRAIN_TIMEOUT)
+        await dispatcher.emit_shutdown(**workflow_data)
+        await bot.session.close()
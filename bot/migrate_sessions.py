@@ -0,0 +1,22 @@
+"""
+Converts sessions stored as JSON under the bare Telegram user id to the
+versioned msgpack schema. Sessions are also converted lazily on first read,
+this just saves waiting for every user to come back.
+
+    python -m bot.migrate_sessions
+"""
+
+import asyncio
+
+from bot.core import redis
+
+
+async def main() -> None:
+    try:
+        print(f"Migrated {await redis.migrate_sessions()} sessions")
+    finally:
+        await redis.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
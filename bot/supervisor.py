@@ -0,0 +1,337 @@
+"""
+Runs the bot as WORKERS processes behind one webhook (BOT_MODE=webhook).
+
+This process serves the webhook and hands every update to a worker chosen
+by the user it comes from, so a user's updates are handled in order by one
+process and its FSM and session state stay there. Workers share Redis, are
+restarted when they die and drain their updates on SIGTERM/SIGINT before
+this process exits.
+
+    python -m bot.supervisor
+"""
+
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from aiohttp import web
+
+from bot.core import config, log, metrics
+from bot.core.webhook import SECRET_HEADER, sender_id
+
+# Workers that keep dying right after starting are restarted less and less
+# often, up to this many seconds apart
+MAX_RESTART_BACKOFF = 30.0
+# Running this long means the worker started fine
+STABLE_UPTIME = 60.0
+# A put waiting on a full queue checks this often whether the queue was
+# replaced meanwhile
+PUT_POLL_INTERVAL = 0.5
+
+
+def shard_of(update: dict, shards: int) -> int:
+    user_id = sender_id(update)
+    return user_id % shards if user_id is not None else 0
+
+
+def _worker(
+    updates: multiprocessing.Queue, env: dict[str, str], start_method: str
+) -> None:
+    os.environ.update(env)
+    # Spawned, but pools of its own (QR_EXECUTOR) start as they would in
+    # ``python -m bot``
+    multiprocessing.set_start_method(start_method, force=True)
+    # Ctrl+C reaches the whole process group, the supervisor decides
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    log.setup()
+
+    try:
+        from bot.__main__ import work
+
+        asyncio.run(work(updates))
+    finally:
+        log.shutdown()
+
+
+class Supervisor:
+    """
+    Starts the workers, each with a queue of its own, and restarts any that
+    exits, backing off while one keeps dying. ``handle`` is the webhook route.
+    """
+
+    def __init__(self, workers: int) -> None:
+        self.workers = workers
+        self.accepting = True
+        self.restarts = 0
+        self.lost = 0
+        self.routed = [0] * workers
+
+        # Workers import the bot themselves instead of inheriting this
+        # process' state (its event loop, open connections)
+        self._context = multiprocessing.get_context("spawn")
+        self._queues = [self._queue() for _ in range(workers)]
+        self._processes: list[multiprocessing.Process | None] = [None] * workers
+        self._started = [0.0] * workers
+        self._failures = [0] * workers
+        self._pending: list[asyncio.TimerHandle | None] = [None] * workers
+        # Blocking queue calls get threads of their own, one per webhook
+        # connection and worker, so a stuck one never holds up the loop's
+        # default executor
+        self._executor = ThreadPoolExecutor(
+            max_workers=config.settings.WEBHOOK_MAX_CONNECTIONS + workers,
+            thread_name_prefix="supervisor",
+        )
+
+    def _env(self, index: int) -> dict[str, str]:
+        settings = config.settings
+        env = {
+            "LOG_DIR": os.path.join(settings.LOG_DIR, f"worker-{index}"),
+            # Telegram's limit is per bot, each worker gets its share
+            "OUTBOX_GLOBAL_RATE": str(settings.OUTBOX_GLOBAL_RATE / self.workers),
+        }
+
+        if settings.METRICS_ENABLED:
+            env["METRICS_PORT"] = str(settings.METRICS_PORT + 1 + index)
+
+        return env
+
+    def _queue(self) -> multiprocessing.Queue:
+        return self._context.Queue(config.settings.WORKER_QUEUE_SIZE)
+
+    def _replace_queue(self, index: int) -> None:
+        # A worker killed while waiting in get() holds the queue's lock for
+        # good, its successor gets a new one. Updates it hadn't read yet are
+        # lost with it
+        stale = self._queues[index]
+        self._queues[index] = self._queue()
+
+        try:
+            self.lost += stale.qsize()
+        except NotImplementedError:  # macOS
+            pass
+
+        stale.cancel_join_thread()
+        stale.close()
+
+    def _spawn(self, index: int) -> None:
+        process = self._context.Process(
+            target=_worker,
+            args=(
+                self._queues[index],
+                self._env(index),
+                multiprocessing.get_start_method(),
+            ),
+            name=f"bot-worker-{index}",
+        )
+        process.start()
+
+        self._processes[index] = process
+        self._started[index] = time.monotonic()
+
+        asyncio.get_running_loop().add_reader(process.sentinel, self._exited, index)
+
+    def start(self) -> None:
+        for index in range(self.workers):
+            self._spawn(index)
+
+    def _exited(self, index: int) -> None:
+        # The process' sentinel became readable: it's gone
+        process = self._processes[index]
+        loop = asyncio.get_running_loop()
+        loop.remove_reader(process.sentinel)
+        process.join()
+
+        if time.monotonic() - self._started[index] >= STABLE_UPTIME:
+            self._failures[index] = 0
+
+        delay = min(
+            config.settings.WORKER_RESTART_BACKOFF * 2 ** self._failures[index],
+            MAX_RESTART_BACKOFF,
+        )
+        self._failures[index] += 1
+
+        logging.error(
+            "Worker %d exited with %s, restarting in %.1fs",
+            index,
+            process.exitcode,
+            delay,
+        )
+
+        process.close()
+        self._processes[index] = None
+        self._replace_queue(index)
+        self._pending[index] = loop.call_later(delay, self._restart, index)
+
+    def _restart(self, index: int) -> None:
+        self._pending[index] = None
+        self.restarts += 1
+        self._spawn(index)
+
+    def _put(self, index: int, raw: bytes, deadline: float) -> bool:
+        # The queue is looked up on every attempt: if the worker dies, the
+        # update goes to its successor's queue instead of the closed one
+        while (remaining := deadline - time.monotonic()) > 0:
+            try:
+                self._queues[index].put(raw, timeout=min(remaining, PUT_POLL_INTERVAL))
+                return True
+            except (queue.Full, ValueError):  # ValueError: closed, replaced
+                continue
+
+        return False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        secret = config.settings.WEBHOOK_SECRET
+
+        if secret and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), secret
+        ):
+            return web.Response(status=401)
+
+        if not self.accepting:
+            return web.Response(status=503)
+
+        raw = await request.read()
+        index = shard_of(json.loads(raw), self.workers)
+
+        try:
+            self._queues[index].put_nowait(raw)
+        except queue.Full:
+            # The worker is behind: hold the response back, as WebhookHandler
+            # does, so that Telegram slows down, and give up after a while
+            if not await asyncio.get_running_loop().run_in_executor(
+                self._executor,
+                self._put,
+                index,
+                raw,
+                time.monotonic() + config.settings.WORKER_QUEUE_TIMEOUT,
+            ):
+                return web.Response(status=503)
+
+        self.routed[index] += 1
+
+        return web.Response()
+
+    async def stop(self) -> None:
+        self.accepting = False
+
+        settings = config.settings
+        loop = asyncio.get_running_loop()
+
+        # Exits from here on are expected
+        for index, process in enumerate(self._processes):
+            if process is not None:
+                loop.remove_reader(process.sentinel)
+
+            if self._pending[index] is not None:
+                self._pending[index].cancel()
+        # Workers drain their updates, then the outbox, before exiting
+        timeout = settings.WEBHOOK_DRAIN_TIMEOUT + settings.OUTBOX_DRAIN_TIMEOUT + 5
+        running = [
+            (updates, process)
+            for updates, process in zip(self._queues, self._processes)
+            if process is not None
+        ]
+
+        async def stop_worker(updates, process) -> None:
+            try:
+                await loop.run_in_executor(
+                    self._executor, partial(updates.put, None, timeout=timeout)
+                )
+            except queue.Full:
+                pass
+
+            await loop.run_in_executor(self._executor, process.join, timeout)
+
+            if process.is_alive():
+                logging.warning("Worker %s did not stop in time", process.name)
+                process.kill()
+                await loop.run_in_executor(self._executor, process.join)
+
+        await asyncio.gather(*(stop_worker(*worker) for worker in running))
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "workers": self.workers,
+            "alive": sum(
+                process is not None and process.is_alive()
+                for process in self._processes
+            ),
+            "restarts": self.restarts,
+            "lost": self.lost,
+            **{f"routed_{index}": count for index, count in enumerate(self.routed)},
+        }
+
+
+async def main() -> None:
+    settings = config.settings
+
+    if settings.BOT_MODE != "webhook" or not settings.WEBHOOK_URL:
+        raise RuntimeError("The supervisor needs BOT_MODE=webhook and WEBHOOK_URL")
+
+    if settings.FSM_STORAGE == "memory":
+        logging.warning("FSM state is lost whenever a worker is restarted")
+
+    # For the webhook's allowed updates only, updates are handled by workers
+    from bot.__main__ import create_bot, dp, set_commands
+
+    bot = create_bot()
+    supervisor = Supervisor(settings.WORKERS or os.cpu_count() or 1)
+    supervisor.start()
+
+    app = web.Application()
+    app.router.add_post(settings.WEBHOOK_PATH, supervisor.handle)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, settings.WEBHOOK_HOST, settings.WEBHOOK_PORT).start()
+
+    metrics.register_collector("bot_supervisor", supervisor.stats)
+    await metrics.start()
+
+    await set_commands(bot)
+    await bot.set_webhook(
+        url=f"{settings.WEBHOOK_URL}{settings.WEBHOOK_PATH}",
+        secret_token=settings.WEBHOOK_SECRET,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=settings.WEBHOOK_MAX_CONNECTIONS,
+    )
+
+    stopped = asyncio.Event()
+    loop = asyncio.get_running_loop()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopped.set)
+
+    logging.info(
+        "Webhook is listening on %s:%s, %d workers",
+        settings.WEBHOOK_HOST,
+        settings.WEBHOOK_PORT,
+        supervisor.workers,
+    )
+
+    try:
+        await stopped.wait()
+    finally:
+        await supervisor.stop()
+        await runner.cleanup()
+        await metrics.stop()
+        await bot.session.close()
+
+
+if __name__ == "__main__":
+    log.setup()
+
+    try:
+        asyncio.run(main())
+    finally:
+        log.shutdown()